@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import get_auth_token_cache, get_auth_token_cache_key
+
+
+User = get_user_model()
+
+
+class CachedUser(SimpleLazyObject):
+    """
+    Пользователь из снимка токена.
+
+    id и признаки авторизации доступны без обращения к БД, остальные
+    поля загружаются одним запросом при первом обращении.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, user_id):
+        def load():
+            # Пользователь мог быть удалён или деактивирован, пока
+            # снимок в LRU другого процесса ещё не истёк.
+            try:
+                return User.objects.get(pk=user_id, is_active=True)
+            except User.DoesNotExist:
+                raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        super().__init__(load)
+        self.__dict__['_user_id'] = user_id
+
+    @property
+    def pk(self):
+        return self.__dict__['_user_id']
+
+    id = pk
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Авторизация по токену с кэшированием снимка токена.
+
+    Снимок содержит только ключ токена, id пользователя и is_active,
+    пользователь восстанавливается лениво (CachedUser). При общем бэкенде
+    кэша (CACHE_BACKEND) снимок живёт AUTH_TOKEN_CACHE_TIMEOUT секунд,
+    иначе хранится в LRU процесса не дольше AUTH_TOKEN_LOCAL_CACHE_TIMEOUT.
+    Снимок сбрасывается при удалении токена (token/logout) и при любом
+    сохранении пользователя, в том числе при деактивации.
+    """
+
+    def authenticate_credentials(self, key):
+        token_cache, timeout = get_auth_token_cache()
+        cache_key = get_auth_token_cache_key(key)
+        snapshot = token_cache.get(cache_key)
+        if (
+            snapshot is not None
+            and snapshot['key'] == key
+            and snapshot['is_active']
+        ):
+            user_id = snapshot['user_id']
+            return CachedUser(user_id), Token(key=key, user_id=user_id)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(cache_key, {
+            'key': token.key,
+            'user_id': user.id,
+            'is_active': user.is_active,
+        }, timeout=timeout)
+        return user, token
@@ -0,0 +1,266 @@
+from hashlib import md5, sha256
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from rest_framework.authtoken.models import Token
+
+from cookbook.models import Recipe, ShoppingCart
+
+from .utils import decode_short_link, generate_short_link
+
+
+SHOPPING_CART_VERSION_KEY = 'shopping_cart_version:{user_id}'
+SHOPPING_CART_KEY = 'shopping_cart:{user_id}:{version}'
+INGREDIENTS_VERSION_KEY = 'ingredients_version'
+TAGS_VERSION_KEY = 'tags_version'
+RECIPES_VERSION_KEY = 'recipes_version'
+RECIPE_VERSION_KEY = 'recipe_version:{recipe_id}'
+RECIPES_PAGE_KEY = 'recipes_page:{version}:{catalog}:{digest}'
+RECIPE_REPRESENTATION_KEY = 'recipe:{recipe_id}:{version}:{catalog}:{host}'
+AUTH_TOKEN_KEY = 'auth_token:{digest}'
+SHORT_LINK_KEY = 'short_link:{digest}'
+
+# Бэкенды, данные которых видны только текущему процессу.
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared_cache():
+    """Общий ли кэш для всех процессов приложения."""
+    return not isinstance(caches['default'], LOCAL_CACHE_BACKENDS)
+
+
+def get_version(key):
+    """
+    Текущая версия кэшируемых данных.
+
+    Версия меняется при каждой инвалидации, поэтому данные старых
+    версий просто перестают читаться и истекают по таймауту.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_catalog_version():
+    """Общая версия каталогов ингредиентов и тегов, входящих в рецепты."""
+    return '{}-{}'.format(
+        get_version(INGREDIENTS_VERSION_KEY), get_version(TAGS_VERSION_KEY))
+
+
+def get_shopping_cart_version(user_id):
+    """Текущая версия списка покупок пользователя."""
+    return get_version(SHOPPING_CART_VERSION_KEY.format(user_id=user_id))
+
+
+def get_shopping_cart_ingredients(user_id, version, queryset):
+    """Кэшированный агрегат ингредиентов списка покупок пользователя."""
+    key = SHOPPING_CART_KEY.format(user_id=user_id, version=version)
+    payloads = caches['payloads']
+    ingredients = payloads.get(key)
+    if ingredients is None:
+        ingredients = list(queryset)
+        payloads.set(
+            key, ingredients, timeout=settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return ingredients
+
+
+def invalidate_shopping_carts(user_ids):
+    """Сброс версий списков покупок пользователей."""
+    cache.delete_many([
+        SHOPPING_CART_VERSION_KEY.format(user_id=user_id)
+        for user_id in user_ids
+    ])
+
+
+def invalidate_recipe_shopping_carts(recipe):
+    """Сброс списков покупок всех пользователей, добавивших рецепт."""
+    invalidate_shopping_carts(
+        ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+    )
+
+
+def invalidate_ingredient_shopping_carts(ingredient_id):
+    """Сброс списков покупок, в рецептах которых есть ингредиент."""
+    invalidate_shopping_carts(
+        ShoppingCart.objects.filter(
+            recipe__recipeingredient__ingredient_id=ingredient_id
+        ).values_list('user_id', flat=True).distinct()
+    )
+
+
+def invalidate_ingredients():
+    """Сброс версии каталога ингредиентов."""
+    cache.delete(INGREDIENTS_VERSION_KEY)
+
+
+def invalidate_tags():
+    """Сброс версии каталога тегов."""
+    cache.delete(TAGS_VERSION_KEY)
+
+
+def get_recipe_versions(recipe_ids):
+    """Версии нескольких рецептов за одно обращение к кэшу."""
+    keys = {
+        recipe_id: RECIPE_VERSION_KEY.format(recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    }
+    versions = cache.get_many(keys.values())
+    missing = {
+        key: uuid4().hex for key in keys.values() if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {
+        recipe_id: versions[key] for recipe_id, key in keys.items()
+    }
+
+
+def get_recipe_representations(request, recipe_ids, serialize):
+    """
+    Общие для всех пользователей представления рецептов из кэша.
+
+    Отсутствующие в кэше рецепты сериализуются одним вызовом serialize,
+    который возвращает словарь представлений по id рецептов.
+    """
+    versions = get_recipe_versions(recipe_ids)
+    catalog = get_catalog_version()
+    host = md5(request.get_host().encode()).hexdigest()
+    keys = {
+        recipe_id: RECIPE_REPRESENTATION_KEY.format(
+            recipe_id=recipe_id, version=version, catalog=catalog, host=host)
+        for recipe_id, version in versions.items()
+    }
+    payloads = caches['payloads']
+    cached = payloads.get_many(keys.values())
+    representations = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items() if key in cached
+    }
+    missing = [
+        recipe_id for recipe_id in recipe_ids
+        if recipe_id not in representations
+    ]
+    if missing:
+        fresh = serialize(missing)
+        payloads.set_many(
+            {keys[recipe_id]: data for recipe_id, data in fresh.items()},
+            timeout=settings.RECIPES_CACHE_TIMEOUT
+        )
+        representations.update(fresh)
+    return representations
+
+
+def get_recipes_page_cache_key(request, recipe_id=None):
+    """
+    Ключ кэша анонимного ответа ленты или страницы рецепта.
+
+    Включает версию ленты (или рецепта) и нормализованную строку запроса,
+    поэтому после инвалидации старые ответы перестают читаться.
+    """
+    if recipe_id is None:
+        version = get_version(RECIPES_VERSION_KEY)
+    else:
+        version = get_version(RECIPE_VERSION_KEY.format(recipe_id=recipe_id))
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in sorted(values)
+    )
+    digest = md5(
+        f'{request.get_host()}{request.path}?{urlencode(params)}'.encode()
+    ).hexdigest()
+    return RECIPES_PAGE_KEY.format(
+        version=version, catalog=get_catalog_version(), digest=digest)
+
+
+def invalidate_recipes(recipe_ids=()):
+    """Сброс кэша ленты рецептов и страниц отдельных рецептов."""
+    cache.delete_many([RECIPES_VERSION_KEY] + [
+        RECIPE_VERSION_KEY.format(recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    ])
+
+
+def invalidate_author_recipes(author):
+    """Сброс кэша рецептов автора, например после смены аватара."""
+    invalidate_recipes(
+        Recipe.objects.filter(author=author).values_list('id', flat=True))
+
+
+def get_auth_token_cache_key(key):
+    """Ключ снимка токена; сам токен в ключ кэша не попадает."""
+    return AUTH_TOKEN_KEY.format(digest=sha256(key.encode()).hexdigest())
+
+
+def get_auth_token_cache():
+    """
+    Кэш снимков токенов и срок их жизни.
+
+    При общем кэше снимки хранятся в нём, иначе — в LRU текущего процесса
+    с коротким сроком жизни, ограничивающим действие отозванного токена.
+    """
+    if is_shared_cache():
+        return cache, settings.AUTH_TOKEN_CACHE_TIMEOUT
+    return caches['auth_tokens'], settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT
+
+
+def invalidate_auth_tokens(keys):
+    """Сброс кэшированных снимков токенов авторизации."""
+    token_cache, _ = get_auth_token_cache()
+    token_cache.delete_many([get_auth_token_cache_key(key) for key in keys])
+
+
+def invalidate_user_auth_tokens(user_id):
+    """Сброс снимков токенов пользователя после изменения его данных."""
+    invalidate_auth_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+def get_short_link_cache_key(short_link):
+    return SHORT_LINK_KEY.format(digest=md5(short_link.encode()).hexdigest())
+
+
+def get_short_link_recipe_id(short_link):
+    """
+    Id рецепта по короткой ссылке или None, если рецепта нет.
+
+    Ссылка декодируется в id рецепта без поиска по столбцу short_link,
+    к БД остаётся только проверка существования. Положительные и
+    отрицательные результаты кэшируются на SHORT_LINK_CACHE_TIMEOUT.
+    """
+    key = get_short_link_cache_key(short_link)
+    recipe_id = cache.get(key)
+    if recipe_id is None:
+        recipe_id = decode_short_link(short_link)
+        if recipe_id is None or not Recipe.objects.filter(
+            id=recipe_id
+        ).exists():
+            # Ссылки, созданные с другой настройкой длины, ищем по столбцу.
+            recipe_id = Recipe.objects.filter(
+                short_link=short_link
+            ).values_list('id', flat=True).first()
+        # 0 в кэше означает отсутствие рецепта.
+        cache.set(
+            key, recipe_id or 0, timeout=settings.SHORT_LINK_CACHE_TIMEOUT)
+    return recipe_id or None
+
+
+def invalidate_short_links(recipe_id, short_link=None):
+    """Сброс кэша коротких ссылок рецепта после создания или удаления."""
+    short_links = {generate_short_link(recipe_id)}
+    if short_link:
+        short_links.add(short_link)
+    cache.delete_many([
+        get_short_link_cache_key(short_link) for short_link in short_links
+    ])
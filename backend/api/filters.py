@@ -1,3 +1,6 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, When
 from django_filters import rest_framework as filters
 
 from cookbook.models import Ingredient, Recipe
@@ -34,7 +37,10 @@ class RecipeFilter(filters.FilterSet):
     def filter_tags(self, queryset, name, value):
         tag_list = self.request.query_params.getlist('tags')
         if tag_list:
-            return queryset.filter(tags__slug__in=tag_list).distinct()
+            # Полусоединение через EXISTS не размножает строки рецептов,
+            # поэтому не требует DISTINCT перед пагинацией и подсчётом.
+            return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag__slug__in=tag_list)))
         return queryset
 
 
@@ -42,7 +48,29 @@ class IngredientFilter(filters.FilterSet):
     """Фильтр по полям ингредиентов."""
 
     name = filters.CharFilter(lookup_expr='istartswith')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Ingredient
-        fields = ['name']
+        fields = ['name', 'search']
+
+    def filter_search(self, queryset, name, value):
+        """
+        Нечёткий поиск с ранжированием: префикс, вхождение, сходство.
+
+        Использует триграммные GIN-индексы pg_trgm и работает только
+        в PostgreSQL; в остальных СУБД IngredientViewSet ранжирует индекс
+        ингредиентов в памяти (IngredientIndex.rank), минуя фильтр.
+        """
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        return queryset.filter(
+            Q(name__icontains=value) | Q(name__trigram_similar=value)
+        ).annotate(
+            rank=Case(
+                When(name__istartswith=value, then=0),
+                When(name__icontains=value, then=1),
+                default=2,
+                output_field=IntegerField()
+            ),
+            similarity=TrigramSimilarity('name', value)
+        ).order_by('rank', '-similarity', 'name', 'id')[:limit]
@@ -0,0 +1,197 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from cookbook.models import Recipe
+
+from .cache import (invalidate_author_recipes, invalidate_recipes,
+                    invalidate_user_auth_tokens)
+
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Поле изображения и поле с готовыми копиями для каждой модели.
+RENDITION_FIELDS = {
+    Recipe: ('image', 'image_renditions'),
+    User: ('avatar', 'avatar_renditions'),
+}
+
+RENDITION_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix='renditions'
+)
+
+
+def get_rendition_sizes(model):
+    return settings.IMAGE_RENDITIONS[model._meta.model_name]
+
+
+def get_rendition_path(name, rendition):
+    """Путь уменьшенной копии рядом с оригиналом в каталоге renditions."""
+    path = Path(name)
+    extension = RENDITION_EXTENSIONS[settings.IMAGE_RENDITION_FORMAT]
+    filename = f'{path.stem}_{rendition}.{extension}'
+    return str(Path('renditions') / path.parent / filename)
+
+
+def get_rendition_urls(field, name, renditions, request):
+    """
+    URL уменьшенных копий файла name из поля изображения field.
+
+    Пока копии текущего файла не готовы, вместо них отдаётся оригинал.
+    """
+    if not name:
+        return None
+    ready = renditions.get('source') == name
+    urls = {}
+    for rendition in get_rendition_sizes(field.model):
+        # Для размера, добавленного после обработки, тоже отдаётся оригинал.
+        url = field.storage.url(
+            renditions.get(rendition, name) if ready else name)
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        urls[rendition] = url
+    return urls
+
+
+def save_rendition(image, size, path, storage):
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.LANCZOS)
+    if settings.IMAGE_RENDITION_FORMAT == 'JPEG':
+        rendition = rendition.convert('RGB')
+    buffer = BytesIO()
+    rendition.save(
+        buffer, format=settings.IMAGE_RENDITION_FORMAT,
+        quality=settings.IMAGE_RENDITION_QUALITY
+    )
+    if storage.exists(path):
+        storage.delete(path)
+    return storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def get_rendition_files(renditions):
+    """Пути файлов копий без ключа source."""
+    return [
+        path for rendition, path in renditions.items()
+        if rendition != 'source'
+    ]
+
+
+def delete_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить файл %s', name)
+
+
+def invalidate_object(model, pk):
+    if model is Recipe:
+        invalidate_recipes([pk])
+    else:
+        invalidate_author_recipes(pk)
+        # Снимок пользователя в кэше авторизации отдаётся в users/me.
+        invalidate_user_auth_tokens(pk)
+
+
+def create_renditions(model, pk, name):
+    """
+    Создание уменьшенных копий изображения объекта.
+
+    Результат сохраняется, только если за время обработки изображение
+    объекта не сменилось; иначе созданные файлы удаляются. Копии
+    предыдущего изображения удаляются после коммита.
+    """
+    image_field, renditions_field = RENDITION_FIELDS[model]
+    storage = model._meta.get_field(image_field).storage
+    renditions = {'source': name}
+    with storage.open(name) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for rendition, size in get_rendition_sizes(model).items():
+            renditions[rendition] = save_rendition(
+                image, size, get_rendition_path(name, rendition), storage)
+    created = get_rendition_files(renditions)
+    with transaction.atomic():
+        queryset = model.objects.select_for_update().filter(
+            pk=pk, **{image_field: name})
+        previous = queryset.values_list(renditions_field, flat=True).first()
+        if previous is None:
+            delete_files(storage, created)
+            return
+        queryset.update(**{renditions_field: renditions})
+        stale = [
+            path for path in get_rendition_files(previous)
+            if path not in created
+        ]
+        transaction.on_commit(lambda: delete_files(storage, stale))
+        transaction.on_commit(lambda: invalidate_object(model, pk))
+
+
+def clear_renditions(instance):
+    """Удаление копий после удаления изображения или самого объекта."""
+    model = type(instance)
+    image_field, renditions_field = RENDITION_FIELDS[model]
+    storage = model._meta.get_field(image_field).storage
+    files = get_rendition_files(getattr(instance, renditions_field) or {})
+    if files:
+        transaction.on_commit(lambda: delete_files(storage, files))
+
+
+def run_task(model, pk, name):
+    try:
+        create_renditions(model, pk, name)
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение %s объекта %s', name, pk)
+
+
+def run_background_task(model, pk, name):
+    try:
+        run_task(model, pk, name)
+    finally:
+        # Поток пула держит собственное соединение с БД; в потоке
+        # запроса соединением управляет Django.
+        close_old_connections()
+
+
+def schedule_renditions(instance, update_fields=None):
+    """
+    Постановка обработки изображения в очередь после коммита транзакции.
+
+    При IMAGE_PROCESSING_EAGER обработка выполняется сразу в текущем
+    потоке, что удобно для тестов и локальной разработки.
+    """
+    model = type(instance)
+    image_field, renditions_field = RENDITION_FIELDS[model]
+    if update_fields is not None and image_field not in update_fields:
+        return
+    file = getattr(instance, image_field)
+    renditions = getattr(instance, renditions_field) or {}
+    if not file:
+        if renditions:
+            clear_renditions(instance)
+            model.objects.filter(pk=instance.pk).update(
+                **{renditions_field: {}})
+            setattr(instance, renditions_field, {})
+        return
+    if renditions.get('source') == file.name:
+        return
+    pk, name = instance.pk, file.name
+    if settings.IMAGE_PROCESSING_EAGER:
+        transaction.on_commit(lambda: run_task(model, pk, name))
+    else:
+        transaction.on_commit(
+            lambda: executor.submit(run_background_task, model, pk, name))
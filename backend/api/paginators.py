@@ -1,7 +1,171 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
-    """Модифицированный пагинатор"""
+    """
+    Модифицированный пагинатор.
+
+    Если в запросе передан параметр cursor (в том числе пустой для первой
+    страницы), вместо номеров страниц используется keyset-пагинация по
+    полям cursor_ordering представления: без COUNT(*) и OFFSET.
+
+    Общее количество объектов для постраничного режима считается
+    стратегией PAGINATION_COUNT_STRATEGY: exact — точный COUNT(*),
+    cached — COUNT(*) с кэшированием по нормализованным параметрам запроса,
+    estimate — оценка pg_class.reltuples для ленты без фильтров
+    (небольшие таблицы считаются точно), иначе как cached.
+    """
 
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = Paginator(object_list, per_page)
+        paginator.count = self.get_count(object_list)
+        return paginator
+
+    def get_count(self, queryset):
+        strategy = settings.PAGINATION_COUNT_STRATEGY
+        if strategy == 'estimate' and not queryset.query.where:
+            estimate = self.get_estimated_count(queryset)
+            if estimate is not None:
+                if estimate < settings.PAGINATION_EXACT_COUNT_LIMIT:
+                    return queryset.count()
+                return estimate
+        if strategy in ('cached', 'estimate'):
+            return cache.get_or_set(
+                self.get_count_cache_key(), queryset.count,
+                settings.PAGINATION_COUNT_CACHE_TIMEOUT
+            )
+        return queryset.count()
+
+    def get_estimated_count(self, queryset):
+        """Оценка числа строк таблицы по статистике PostgreSQL."""
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # До первого ANALYZE reltuples не заполнен.
+        if row is None or row[0] <= 0:
+            return None
+        return row[0]
+
+    def get_count_cache_key(self):
+        params = sorted(
+            (key, value)
+            for key, values in self.request.query_params.lists()
+            if key not in (
+                self.page_query_param, self.page_size_query_param)
+            for value in sorted(values)
+        )
+        user = self.request.user
+        user_id = user.id if user.is_authenticated else None
+        digest = md5(
+            f'{self.request.path}?{urlencode(params)}'.encode()).hexdigest()
+        return f'count:{user_id}:{digest}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        ordering = getattr(view, 'cursor_ordering', ('-id',))
+        queryset = queryset.order_by(*ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.get_cursor_filter(queryset.model, ordering, cursor))
+
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            # isoformat() сохраняет микросекунды, без которых курсор
+            # по дате создания пропускал бы рецепты.
+            self.next_position = [
+                self.encode_value(getattr(page[-1], field.lstrip('-')))
+                for field in ordering
+            ]
+        return page
+
+    @staticmethod
+    def encode_value(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def get_cursor_filter(self, model, ordering, cursor):
+        """
+        Условие «строго после курсора» для лексикографического порядка:
+        (a > x) OR (a = x AND b > y) OR ... с учётом направления полей.
+        """
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            fields = [field.lstrip('-') for field in ordering]
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            values = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(fields, values)
+            ]
+            # Сравнение с NULL в условии курсора недопустимо.
+            if None in values:
+                raise ValueError
+        except (BinasciiError, UnicodeDecodeError, TypeError, ValueError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        for index, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                name.lstrip('-'): value
+                for name, value in zip(ordering[:index], values)
+            }
+            condition |= Q(
+                **equal, **{f'{field.lstrip("-")}__{lookup}': values[index]})
+        return condition
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        cursor = urlsafe_b64encode(
+            json.dumps(self.next_position).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, cursor
+        )
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,149 @@
+import csv
+import json
+
+import orjson
+from django.conf import settings
+from fpdf import FPDF
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на основе orjson.
+
+    Типы, которые orjson не поддерживает (Decimal, ленивые строки
+    переводов и т.п.), приводятся так же, как в стандартном JSONEncoder
+    DRF. Для ответов с отступами используется стандартный рендерер.
+    """
+
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        content = orjson.dumps(
+            data, default=JSONEncoder().default, option=self.options)
+        # Как и JSONRenderer, экранируем разделители строк для JavaScript.
+        return content.replace(
+            b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанное значение вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+class BaseShoppingCartRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+
+    Наследники реализуют генератор stream, который построчно формирует
+    файл из итерируемого объекта со словарями, содержащими название,
+    единицу измерения и суммарное количество ингредиента.
+    """
+
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        raise NotImplementedError(
+            'Рендерер должен реализовать метод stream()')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Файл отдаётся потоком из stream(), через render проходят только
+        # ошибки (например, 401) — в JSON, как и остальной API.
+        renderer_context['response']['Content-Type'] = (
+            JSONRenderer.media_type)
+        return JSONRenderer().render(data)
+
+
+class CSVShoppingCartRenderer(BaseShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo(), delimiter=',')
+        yield writer.writerow(['Ингредиент', 'Количество', 'Ед. измерения'])
+        for ingredient in ingredients:
+            yield writer.writerow([
+                ingredient['ingredient__name'],
+                ingredient['total_amount'],
+                ingredient['ingredient__measurement_unit']
+            ])
+
+
+class TextShoppingCartRenderer(BaseShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield 'Список покупок\n\n'
+        for ingredient in ingredients:
+            yield (
+                f'- {ingredient["ingredient__name"]} '
+                f'({ingredient["ingredient__measurement_unit"]}) — '
+                f'{ingredient["total_amount"]}\n'
+            )
+
+
+class JSONShoppingCartRenderer(BaseShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['total_amount'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+class PDFShoppingCartRenderer(BaseShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients):
+        # fpdf2 собирает документ в памяти, строки при этом читаются
+        # из итератора по одной.
+        pdf = FPDF(format='A4')
+        pdf.set_title('Список покупок')
+        pdf.add_font('ShoppingCart', fname=settings.SHOPPING_CART_PDF_FONT)
+        pdf.add_page()
+        pdf.set_font('ShoppingCart', size=16)
+        pdf.cell(text='Список покупок', new_x='LMARGIN', new_y='NEXT')
+        pdf.ln(4)
+        pdf.set_font(size=11)
+        for ingredient in ingredients:
+            line = (
+                f'• {ingredient["ingredient__name"]} '
+                f'({ingredient["ingredient__measurement_unit"]}) — '
+                f'{ingredient["total_amount"]}'
+            )
+            # multi_cell с переносом заметно медленнее, поэтому
+            # используется только для строк шире страницы.
+            if pdf.get_string_width(line) <= pdf.epw:
+                pdf.cell(text=line, h=6, new_x='LMARGIN', new_y='NEXT')
+            else:
+                pdf.multi_cell(0, 6, line, new_x='LMARGIN', new_y='NEXT')
+        yield bytes(pdf.output())
+
+
+# Реестр форматов списка покупок. Первый рендерер используется по умолчанию,
+# формат выбирается параметром ?format= или заголовком Accept.
+SHOPPING_CART_RENDERERS = (
+    CSVShoppingCartRenderer,
+    TextShoppingCartRenderer,
+    JSONShoppingCartRenderer,
+    PDFShoppingCartRenderer,
+)
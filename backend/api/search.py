@@ -0,0 +1,146 @@
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+from cookbook.models import Ingredient
+
+from .cache import INGREDIENTS_VERSION_KEY, get_version
+
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def get_trigrams(value):
+    """Множество триграмм строки, построенное по правилам pg_trgm."""
+    trigrams = set()
+    for word in WORD_PATTERN.findall(value.casefold()):
+        word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def get_similarity(common, size, other_size):
+    """
+    Аналог функции similarity() из pg_trgm по числу общих триграмм
+    и размерам множеств триграмм обеих строк.
+    """
+    if not common:
+        return 0
+    return common / (size + other_size - common)
+
+
+class IngredientIndex:
+    """
+    Отсортированный индекс каталога ингредиентов в памяти процесса.
+
+    Хранит названия в casefold-регистре и отвечает на поиск по префиксу
+    бинарным поиском без обращения к БД. Индекс перестраивается при смене
+    версии каталога в кэше (изменения в админке, загрузка ингредиентов)
+    и не реже, чем раз в INGREDIENT_INDEX_TIMEOUT секунд.
+
+    Для нечёткого поиска хранит триграммы названий и обратный индекс
+    «триграмма — позиции названий», чтобы ранжировать только кандидатов.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._built_at = None
+        self._index = ([], [], [], {})
+
+    def _is_stale(self, version):
+        return (
+            self._version != version
+            or monotonic() - self._built_at > settings.INGREDIENT_INDEX_TIMEOUT
+        )
+
+    def _build(self, version):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].casefold(), item['id'])
+        )
+        keys = [item['name'].casefold() for item in items]
+        trigrams = [get_trigrams(key) for key in keys]
+        postings = defaultdict(list)
+        for position, key_trigrams in enumerate(trigrams):
+            for trigram in key_trigrams:
+                postings[trigram].append(position)
+        self._index = (keys, items, trigrams, dict(postings))
+        self._version = version
+        self._built_at = monotonic()
+
+    def get_items(self):
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self._build(version)
+        return self._index
+
+    def all(self):
+        """Весь каталог в алфавитном порядке."""
+        return self.get_items()[1]
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix."""
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        keys, items, _, _ = self.get_items()
+        prefix = prefix.casefold()
+        result = []
+        index = bisect_left(keys, prefix)
+        while (
+            index < len(keys)
+            and len(result) < limit
+            and keys[index].startswith(prefix)
+        ):
+            result.append(items[index])
+            index += 1
+        return result
+
+    def rank(self, query, limit=None):
+        """
+        Нечёткий поиск: сначала совпадения по префиксу, затем по вхождению,
+        затем по триграммному сходству не ниже INGREDIENT_TRIGRAM_THRESHOLD.
+        """
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        keys, items, trigrams, postings = self.get_items()
+        query = query.casefold()
+        query_trigrams = get_trigrams(query)
+        if any(len(word) >= 3 for word in WORD_PATTERN.findall(query)):
+            # Префикс или вхождение слова из трёх и более символов,
+            # как и ненулевое сходство, дают общую с запросом триграмму:
+            # считаются только названия из обратного индекса.
+            common = Counter()
+            for trigram in query_trigrams:
+                common.update(postings.get(trigram, ()))
+            candidates = common.items()
+        else:
+            candidates = (
+                (position, len(query_trigrams & item_trigrams))
+                for position, item_trigrams in enumerate(trigrams)
+            )
+        ranked = []
+        for position, shared in candidates:
+            key, item = keys[position], items[position]
+            similarity = get_similarity(
+                shared, len(query_trigrams), len(trigrams[position]))
+            if key.startswith(query):
+                rank = 0
+            elif query in key:
+                rank = 1
+            elif similarity >= settings.INGREDIENT_TRIGRAM_THRESHOLD:
+                rank = 2
+            else:
+                continue
+            ranked.append((rank, -similarity, key, item['id'], item))
+        ranked.sort(key=lambda row: row[:4])
+        return [row[-1] for row in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
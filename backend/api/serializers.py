@@ -1,6 +1,6 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
@@ -9,6 +9,10 @@ from cookbook.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                              ShoppingCart, Tag)
 from users.models import Subscription
 
+from .cache import invalidate_recipe_shopping_carts
+from .images import get_rendition_urls
+from .utils import generate_short_link, get_recipes_limit
+
 
 User = get_user_model()
 
@@ -17,6 +21,7 @@ class UserSerializer(BaseUserSerializer):
     """Сериализатор модели пользователей."""
 
     avatar = Base64ImageField(required=False)
+    avatar_renditions = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(BaseUserSerializer.Meta):
@@ -28,17 +33,36 @@ class UserSerializer(BaseUserSerializer):
             'first_name',
             'last_name',
             'avatar',
+            'avatar_renditions',
             'is_subscribed'
         )
 
+    def get_avatar_renditions(self, obj):
+        return get_rendition_urls(
+            User._meta.get_field('avatar'), obj.avatar.name,
+            obj.avatar_renditions, self.context.get('request')
+        )
+
     def get_is_subscribed(self, obj):
+        # Значение может быть заранее проаннотировано во ViewSet.
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         follower = self.context['request'].user
         if not follower.is_authenticated:
             return False
-        following = get_object_or_404(User, id=obj.id)
-        return Subscription.objects.filter(
-            follower=follower, following=following
-        ).exists()
+        return obj.id in self.get_following_ids(follower)
+
+    def get_following_ids(self, follower):
+        """
+        Id авторов, на которых подписан пользователь.
+
+        Загружаются одним запросом и кэшируются в контексте корневого
+        сериализатора, чтобы не обращаться к БД для каждого объекта списка.
+        """
+        if 'following_ids' not in self.context:
+            self.context['following_ids'] = set(
+                follower.followers.values_list('following_id', flat=True))
+        return self.context['following_ids']
 
 
 class ExtendedUserSerializer(UserSerializer):
@@ -51,12 +75,8 @@ class ExtendedUserSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.get(
-            'recipes_limit', settings.DEFAULT_RECIPES_LIMIT)
-        if str(recipes_limit).isdigit():
-            recipes_limit = int(recipes_limit)
-        else:
-            recipes_limit = settings.DEFAULT_RECIPES_LIMIT
+        recipes_limit = get_recipes_limit(self.context.get('recipes_limit'))
+        # При предзагрузке во ViewSet срез берётся из кэша без запроса к БД.
         recipes = obj.recipes.all()[:recipes_limit]
         return ShortRecipeInfoSerializer(recipes, many=True).data
 
@@ -118,9 +138,12 @@ class GetRecipesSerializer(serializers.ModelSerializer):
 
     author = UserSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True)
+    ingredients = GetRecipeIngredientsSerializer(
+        source='recipeingredient', read_only=True, many=True)
     is_favorited = serializers.BooleanField(read_only=True, default=False)
     is_in_shopping_cart = serializers.BooleanField(
         read_only=True, default=False)
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -133,16 +156,121 @@ class GetRecipesSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time',
         )
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        ingredients = instance.recipeingredient.all()
-        representation['ingredients'] = GetRecipeIngredientsSerializer(
-            ingredients, many=True).data
-        return representation
+    def get_image_renditions(self, obj):
+        return get_recipe_image_renditions(obj, self.context.get('request'))
+
+
+class CreatedRecipeSerializer(GetRecipesSerializer):
+    """
+    Представление только что созданного рецепта.
+
+    Теги и ингредиенты берутся из объектов, сохранённых в том же запросе
+    (context['tags'] и context['recipe_ingredients']), без чтения из БД.
+    """
+
+    tags = serializers.SerializerMethodField()
+    ingredients = serializers.SerializerMethodField()
+
+    def get_tags(self, obj):
+        return TagSerializer(many=True).to_representation(
+            self.context['tags'])
+
+    def get_ingredients(self, obj):
+        return GetRecipeIngredientsSerializer(many=True).to_representation(
+            self.context['recipe_ingredients'])
+
+
+def get_recipe_image_renditions(recipe, request):
+    return get_rendition_urls(
+        Recipe._meta.get_field('image'), recipe.image.name,
+        recipe.image_renditions, request
+    )
+
+
+def get_file_url(field, name, request):
+    """URL файла так же, как его формирует ImageField из DRF."""
+    if not name:
+        return None
+    url = field.storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def build_recipe_representations(recipe_ids, request):
+    """
+    Быстрая сериализация рецептов для чтения.
+
+    Строит словари напрямую из строк .values() тремя запросами, минуя
+    поля DRF. Результат совпадает с GetRecipesSerializer для пользователя
+    без подписок, избранного и списка покупок.
+    """
+    image_field = Recipe._meta.get_field('image')
+    avatar_field = User._meta.get_field('avatar')
+    tags = {}
+    for row in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values(
+        'recipe_id', 'tag__id', 'tag__name', 'tag__slug'
+    ).order_by('tag__id', 'tag__name'):
+        tags.setdefault(row['recipe_id'], []).append({
+            'id': row['tag__id'],
+            'name': row['tag__name'],
+            'slug': row['tag__slug'],
+        })
+    ingredients = {}
+    for row in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values(
+        'recipe_id', 'ingredient__id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ).order_by('id'):
+        ingredients.setdefault(row['recipe_id'], []).append({
+            'id': row['ingredient__id'],
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['amount'],
+        })
+    representations = {}
+    for row in Recipe.objects.filter(id__in=recipe_ids).values(
+        'id', 'name', 'image', 'text', 'cooking_time', 'author__email',
+        'author__id', 'author__username', 'author__first_name',
+        'author__last_name', 'author__avatar', 'author__avatar_renditions',
+        'image_renditions'
+    ):
+        representations[row['id']] = {
+            'id': row['id'],
+            'tags': tags.get(row['id'], []),
+            'author': {
+                'email': row['author__email'],
+                'id': row['author__id'],
+                'username': row['author__username'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'avatar': get_file_url(
+                    avatar_field, row['author__avatar'], request),
+                'avatar_renditions': get_rendition_urls(
+                    avatar_field, row['author__avatar'],
+                    row['author__avatar_renditions'], request
+                ),
+                'is_subscribed': False,
+            },
+            'ingredients': ingredients.get(row['id'], []),
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': row['name'],
+            'image': get_file_url(image_field, row['image'], request),
+            'image_renditions': get_rendition_urls(
+                image_field, row['image'], row['image_renditions'], request),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+    return representations
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -156,11 +284,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор модели рецептов"""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    # id тегов проверяются в validate одним запросом.
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = RecipeIngredientSerializer(many=True)
     image = Base64ImageField()
 
+    # Теги и ингредиенты, сохранённые в create().
+    created_relations = None
+
     class Meta:
         model = Recipe
         fields = (
@@ -173,33 +304,92 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def create_ingredients(self, ingredients, recipe):
-        RecipeIngredient.objects.bulk_create(
+        return RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'),)
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount'],)
             for ingredient in ingredients
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
+        tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        self.create_ingredients(recipe=recipe, ingredients=ingredients)
-        recipe.tags.set(tags_data)
+        recipe.short_link = generate_short_link(recipe.id)
+        recipe.save(update_fields=('short_link',))
+        recipe_ingredients = self.create_ingredients(ingredients, recipe)
+        # У нового рецепта нет тегов, поэтому set() с его выборкой
+        # существующих связей не нужен.
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags)
+        # Связи отдаются в ответе из памяти, без повторных запросов.
+        # Теги сортируются так же, как в Tag.Meta.ordering.
+        self.created_relations = {
+            'tags': sorted(tags, key=lambda tag: (tag.id, tag.name)),
+            'recipe_ingredients': recipe_ingredients,
+        }
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Обновление ингредиентов рецепта по разнице с текущими строками.
+
+        Возвращает True, если состав рецепта изменился.
+        """
+        amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipeingredient.all()
+        }
+        removed = [
+            recipe_ingredient.id
+            for ingredient_id, recipe_ingredient in existing.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient'].id not in existing
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.create_ingredients(added, recipe)
+        return bool(removed or changed or added)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        # set() сам удаляет и добавляет только отличающиеся теги.
         instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
+        if self.update_ingredients(ingredients, instance):
+            # Только после коммита: иначе выгрузка, пришедшая до него,
+            # закэширует старый агрегат под новой версией списка.
+            transaction.on_commit(
+                lambda: invalidate_recipe_shopping_carts(instance))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
-        context = {'request': request}
+        # Изменять рецепт может только автор, а подписаться на себя нельзя.
+        context = {'request': request, 'following_ids': set()}
+        if self.created_relations is not None:
+            return CreatedRecipeSerializer(
+                instance, context={**context, **self.created_relations}
+            ).data
         return GetRecipesSerializer(instance, context=context).data
 
     def validate_image(self, value):
@@ -224,20 +414,31 @@ class RecipeSerializer(serializers.ModelSerializer):
         if len(data['tags']) > len(set(data['tags'])):
             raise serializers.ValidationError(
                 {'tags': 'Теги не могут повторяться'})
-        ingredient_list = []
-        for ingredient_item in ingredients:
-            ingredient = Ingredient.objects.filter(
-                id=ingredient_item['id']).first()
-            # XXX: делаем фильтрацию вручную,
-            # чтобы при ошибке вернуть 400, а не 404
-            if ingredient is None:
+        tags = Tag.objects.in_bulk(data['tags'])
+        if len(tags) < len(data['tags']):
+            raise serializers.ValidationError(
+                {'tags': 'Тега с таким id не существует'})
+        data['tags'] = [tags[tag_id] for tag_id in data['tags']]
+        # XXX: делаем фильтрацию вручную,
+        # чтобы при ошибке вернуть 400, а не 404
+        requested_ids = [
+            int(ingredient_item['id'])
+            if str(ingredient_item['id']).isdigit() else None
+            for ingredient_item in ingredients
+        ]
+        existing = Ingredient.objects.in_bulk(
+            [id for id in requested_ids if id is not None])
+        ingredient_ids = set()
+        validated_ingredients = []
+        for ingredient_item, ingredient_id in zip(ingredients, requested_ids):
+            if ingredient_id not in existing:
                 raise serializers.ValidationError(
                     {'ingredients': 'Ингредиента с таким id не существует'}
                 )
-            if ingredient in ingredient_list:
+            if ingredient_id in ingredient_ids:
                 raise serializers.ValidationError(
                     {'ingredients': 'Ингредиенты должны быть уникальными'})
-            ingredient_list.append(ingredient)
+            ingredient_ids.add(ingredient_id)
             if int(ingredient_item['amount']) < 1:
                 raise serializers.ValidationError(
                     {
@@ -245,9 +446,13 @@ class RecipeSerializer(serializers.ModelSerializer):
                         'Убедитесь, что количество ингредиента больше 0'
                     }
                 )
+            validated_ingredients.append({
+                'ingredient': existing[ingredient_id],
+                'amount': int(ingredient_item['amount']),
+            })
         # if not data.get('image') or data.get('image') == '':
         #     raise serializers.ValidationError({'image': 'Обязательное поле'})
-        data['ingredients'] = ingredients
+        data['ingredients'] = validated_ingredients
         return data
 
 
@@ -261,7 +466,10 @@ class ShortLinkSerializer(serializers.ModelSerializer):
         fields = ('short_link',)
 
     def get_short_link(self, obj):
-        return f'{settings.SITE_URL}/s/{obj.short_link}/'
+        # Рецепты, созданные до генерации ссылок при создании, заполняются
+        # командой backfill_short_links; до этого ссылка вычисляется.
+        short_link = obj.short_link or generate_short_link(obj.id)
+        return f'{settings.SITE_URL}/s/{short_link}/'
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -272,9 +480,14 @@ class ShortLinkSerializer(serializers.ModelSerializer):
 class ShortRecipeInfoSerializer(serializers.ModelSerializer):
     """Укороченный сериализатор рецептов."""
 
+    image_renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
+
+    def get_image_renditions(self, obj):
+        return get_recipe_image_renditions(obj, self.context.get('request'))
 
 
 class BaseUserRecipeSerializer(serializers.ModelSerializer):
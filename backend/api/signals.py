@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from cookbook.models import (Ingredient, Recipe, RecipeIngredient,
+                             ShoppingCart, Tag)
+
+from .cache import (invalidate_auth_tokens, invalidate_author_recipes,
+                    invalidate_ingredient_shopping_carts,
+                    invalidate_ingredients, invalidate_recipe_shopping_carts,
+                    invalidate_recipes, invalidate_shopping_carts,
+                    invalidate_short_links, invalidate_tags,
+                    invalidate_user_auth_tokens)
+from .images import clear_renditions, schedule_renditions
+
+
+User = get_user_model()
+
+# Поля пользователя, входящие в кэшированные представления рецептов.
+AUTHOR_FIELDS = frozenset((
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_renditions',
+))
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Перестроение индекса ингредиентов после изменения каталога."""
+    transaction.on_commit(invalidate_ingredients)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    """Сброс списков покупок после переименования ингредиента."""
+    # Удаление ингредиента каскадом удаляет строки рецептов,
+    # их обрабатывает recipe_ingredient_changed.
+    if not created:
+        ingredient_id = instance.id
+        transaction.on_commit(
+            lambda: invalidate_ingredient_shopping_carts(ingredient_id))
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    """Сброс версии списка покупок, в том числе при каскадном удалении."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_shopping_carts([user_id]))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, **kwargs):
+    """Сброс кэша тегов после изменения в админке."""
+    transaction.on_commit(invalidate_tags)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """Сброс отрицательного результата кэша для ссылки нового рецепта."""
+    if created:
+        recipe_id = instance.id
+        transaction.on_commit(lambda: invalidate_short_links(recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Сброс кэша коротких ссылок удалённого рецепта."""
+    # После удаления у объекта сбрасывается pk, поэтому значения
+    # запоминаются заранее.
+    recipe_id, short_link = instance.id, instance.short_link
+    transaction.on_commit(
+        lambda: invalidate_short_links(recipe_id, short_link))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """
+    Сброс кэша рецепта и ленты при любом изменении рецепта.
+
+    Срабатывает и для правок в админке, минуя представления API.
+    """
+    recipe_id = instance.id
+    transaction.on_commit(lambda: invalidate_recipes([recipe_id]))
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Сброс кэша рецепта и списков покупок с ним при изменении состава."""
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: invalidate_recipes([recipe_id]))
+    # Если рецепт удаляется целиком, списки покупок сбросит
+    # shopping_cart_changed, а здесь запрос вернёт пустой результат.
+    transaction.on_commit(
+        lambda: invalidate_recipe_shopping_carts(recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс кэша рецептов при изменении тегов, в том числе со стороны тега."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'pre_clear':
+        recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    else:
+        recipe_ids = list(pk_set)
+    transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """Сброс кэша рецептов автора после изменения его профиля."""
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        # Например, обновление last_login при входе.
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_author_recipes(user_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_changed(sender, instance, update_fields=None, **kwargs):
+    """Создание уменьшенных копий нового изображения рецепта или аватара."""
+    schedule_renditions(instance, update_fields)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_deleted(sender, instance, **kwargs):
+    """Удаление уменьшенных копий изображения удалённого объекта."""
+    clear_renditions(instance)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Сброс снимка токена при выходе пользователя (token/logout)."""
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_auth_tokens([key]))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Сброс снимков токенов при изменении или деактивации пользователя."""
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user_auth_tokens(user_id))
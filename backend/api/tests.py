@@ -0,0 +1,557 @@
+import shutil
+import tempfile
+from base64 import b64decode, urlsafe_b64encode
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from cookbook.models import (Ingredient, Recipe, RecipeIngredient,
+                             ShoppingCart, Tag)
+from users.models import Subscription
+
+from .cache import get_auth_token_cache_key
+from .images import (create_renditions, get_rendition_path,
+                     get_rendition_urls)
+from .renderers import ORJSONRenderer
+from .serializers import (GetRecipesSerializer, RecipeSerializer,
+                          build_recipe_representations)
+
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Размеры страниц, на которых число запросов должно совпадать.
+PAGE_SIZES = (2, 6)
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+# Уменьшенные копии изображений создаются в потоке теста: фоновый поток
+# не видит данных незавершённой транзакции TestCase.
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_EAGER=True)
+class APITestCase(TestCase):
+    """Общие данные: читатель, подписанный на шесть авторов, и их рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'reader', 'reader@example.com', 'Имя', 'Фамилия', 'password')
+        cls.authors = [
+            User.objects.create_user(
+                f'author{index}', f'author{index}@example.com',
+                'Имя', 'Фамилия', 'password'
+            )
+            for index in range(6)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(40)
+        ]
+        cls.recipes = []
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.authors[index % 6], name=f'Рецепт {index}',
+                image='recipe_images/test.png', text='Описание',
+                cooking_time=10
+            )
+            recipe.tags.set(cls.tags[:2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+                for ingredient in cls.ingredients[index:index + 3]
+            )
+            cls.recipes.append(recipe)
+        for author in cls.authors:
+            Subscription.objects.create(follower=cls.user, following=author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        clear_caches()
+        self.anonymous_client = APIClient()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(self.user)
+
+    def get_recipe_data(self, ingredients_count=1, **kwargs):
+        data = {
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients[:ingredients_count]
+            ],
+            'image': IMAGE,
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }
+        data.update(kwargs)
+        return data
+
+
+class ListQueryCountTest(APITestCase):
+    """Число запросов списков не зависит от размера страницы."""
+
+    def assert_list_queries(self, client, url, cold, warm=None):
+        for page_size in PAGE_SIZES:
+            with self.subTest(url=url, page_size=page_size):
+                clear_caches()
+                page_url = f'{url}?limit={page_size}'
+                with self.assertNumQueries(cold):
+                    response = client.get(page_url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.json()['results']), page_size)
+                if warm is not None:
+                    with self.assertNumQueries(warm):
+                        client.get(page_url)
+
+    def test_recipes_anonymous(self):
+        self.assert_list_queries(
+            self.anonymous_client, '/api/recipes/', cold=5, warm=0)
+
+    def test_recipes_authorized(self):
+        # Представления рецептов берутся из кэша, остаются подсчёт,
+        # страница с флагами пользователя и запрос подписок.
+        self.assert_list_queries(
+            self.authorized_client, '/api/recipes/', cold=6, warm=3)
+
+    def test_users(self):
+        self.assert_list_queries(self.authorized_client, '/api/users/', 2)
+
+    def test_subscriptions(self):
+        self.assert_list_queries(
+            self.authorized_client, '/api/users/subscriptions/', 3)
+
+
+class RecipeValidationTest(APITestCase):
+    """Проверка тегов и ингредиентов рецепта."""
+
+    def get_serializer(self, data):
+        request = APIRequestFactory().post('/api/recipes/')
+        request.user = self.user
+        return RecipeSerializer(data=data, context={'request': request})
+
+    def test_query_count_does_not_depend_on_ingredients(self):
+        # Один запрос тегов и один запрос ингредиентов.
+        for ingredients_count in (1, 40):
+            with self.subTest(ingredients_count=ingredients_count):
+                serializer = self.get_serializer(
+                    self.get_recipe_data(ingredients_count))
+                with self.assertNumQueries(2):
+                    self.assertTrue(serializer.is_valid(), serializer.errors)
+                self.assertEqual(
+                    len(serializer.validated_data['ingredients']),
+                    ingredients_count
+                )
+
+    def assert_bad_request(self, data, field, message=None):
+        response = self.authorized_client.post(
+            '/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(field, response.json())
+        if message is not None:
+            self.assertIn(message, response.json()[field])
+        self.assertFalse(Recipe.objects.filter(name=data['name']).exists())
+
+    def test_unknown_ingredient(self):
+        self.assert_bad_request(
+            self.get_recipe_data(ingredients=[{'id': 0, 'amount': 10}]),
+            'ingredients', 'Ингредиента с таким id не существует'
+        )
+
+    def test_duplicate_ingredient(self):
+        ingredient = {'id': self.ingredients[0].id, 'amount': 10}
+        self.assert_bad_request(
+            self.get_recipe_data(ingredients=[ingredient, ingredient]),
+            'ingredients', 'Ингредиенты должны быть уникальными'
+        )
+
+    def test_unknown_tag(self):
+        self.assert_bad_request(
+            self.get_recipe_data(tags=[self.tags[0].id, 0]),
+            'tags', 'Тега с таким id не существует'
+        )
+
+    def test_non_integer_tag(self):
+        self.assert_bad_request(self.get_recipe_data(tags=['тег']), 'tags')
+
+
+class RecipeCreateTest(APITestCase):
+    """Создание рецепта."""
+
+    def test_query_count_does_not_depend_on_ingredients(self):
+        # Теги и ингредиенты, рецепт, короткая ссылка, ингредиенты
+        # и теги рецепта одной вставкой каждые, плюс точка сохранения
+        # транзакции create.
+        for ingredients_count in (1, 40):
+            with self.subTest(ingredients_count=ingredients_count):
+                with self.assertNumQueries(8):
+                    response = self.authorized_client.post(
+                        '/api/recipes/',
+                        self.get_recipe_data(
+                            ingredients_count,
+                            name=f'Рецепт из {ingredients_count}'
+                        ),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(
+                    len(response.json()['ingredients']), ingredients_count)
+
+    def test_response_matches_retrieve(self):
+        # Теги переданы не в порядке Tag.Meta.ordering.
+        data = self.get_recipe_data(
+            3, tags=[tag.id for tag in reversed(self.tags[:2])])
+        response = self.authorized_client.post(
+            '/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(),
+            self.authorized_client.get(
+                f'/api/recipes/{response.json()["id"]}/').json()
+        )
+
+    def test_failure_rolls_back_recipe(self):
+        data = self.get_recipe_data(name='Несохранённый рецепт')
+        with patch.object(
+            RecipeSerializer, 'create_ingredients',
+            side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.authorized_client.post(
+                    '/api/recipes/', data, format='json')
+        self.assertFalse(Recipe.objects.filter(name=data['name']).exists())
+
+
+class RecipeRepresentationTest(APITestCase):
+    """Быстрая сериализация совпадает с GetRecipesSerializer."""
+
+    def test_matches_serializer(self):
+        User.objects.filter(id=self.authors[0].id).update(
+            avatar='avatars/author.png',
+            avatar_renditions={
+                'source': 'avatars/author.png',
+                'thumbnail': 'renditions/avatars/author_thumbnail.webp',
+            }
+        )
+        Recipe.objects.filter(id=self.recipes[0].id).update(
+            image_renditions={
+                'source': 'recipe_images/test.png',
+                'thumbnail': 'renditions/recipe_images/test_thumbnail.webp',
+                'card': 'renditions/recipe_images/test_card.webp',
+                'detail': 'renditions/recipe_images/test_detail.webp',
+            }
+        )
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        representations = build_recipe_representations(recipe_ids, request)
+        serializer = GetRecipesSerializer(
+            Recipe.objects.filter(id__in=recipe_ids).order_by('id'),
+            many=True, context={'request': request}
+        )
+        # Сравнение с рендерером, которым API отдаёт ответы.
+        renderer = ORJSONRenderer()
+        self.assertEqual(
+            renderer.render([
+                representations[recipe_id] for recipe_id in recipe_ids]),
+            renderer.render(serializer.data)
+        )
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    """Выгрузка списка покупок в разных форматах."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        for recipe in self.recipes[:3]:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def test_formats(self):
+        for file_format, content_type, start in (
+            ('csv', 'text/csv; charset=utf-8', 'Ингредиент'.encode()),
+            ('txt', 'text/plain; charset=utf-8', 'Список'.encode()),
+            ('json', 'application/json; charset=utf-8', b'[{'),
+            ('pdf', 'application/pdf', b'%PDF-'),
+        ):
+            with self.subTest(format=file_format):
+                response = self.authorized_client.get(
+                    self.url, {'format': file_format})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], content_type)
+                content = b''.join(response.streaming_content)
+                self.assertTrue(content.startswith(start))
+
+    def test_pdf_structure(self):
+        response = self.authorized_client.get(self.url, {'format': 'pdf'})
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+        # Шрифт с кириллицей встроен, текст извлекается через ToUnicode.
+        self.assertIn(b'/FontFile2', content)
+        self.assertIn(b'/ToUnicode', content)
+
+    def get_etag(self):
+        response = self.authorized_client.get(self.url, {'format': 'csv'})
+        b''.join(response.streaming_content)
+        return response['ETag']
+
+    def assert_etag_changes(self, change):
+        etag = self.get_etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        new_etag = self.get_etag()
+        self.assertNotEqual(new_etag, etag)
+        response = self.authorized_client.get(
+            self.url, {'format': 'csv'}, HTTP_IF_NONE_MATCH=new_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cart_change_updates_etag(self):
+        url = f'/api/recipes/{self.recipes[5].id}/shopping_cart/'
+        self.assert_etag_changes(
+            lambda: self.assertEqual(
+                self.authorized_client.post(url).status_code, 201))
+        self.assert_etag_changes(
+            lambda: self.assertEqual(
+                self.authorized_client.delete(url).status_code, 204))
+
+    def test_recipe_ingredients_change_updates_etag(self):
+        author_client = APIClient()
+        author_client.force_authenticate(self.authors[0])
+        recipe = self.recipes[0]
+        self.assert_etag_changes(
+            lambda: self.assertEqual(
+                author_client.patch(
+                    f'/api/recipes/{recipe.id}/',
+                    self.get_recipe_data(5), format='json'
+                ).status_code,
+                200
+            )
+        )
+
+        def edit_amount():
+            # Правка строки рецепта, например, в админке.
+            recipe_ingredient = recipe.recipeingredient.first()
+            recipe_ingredient.amount += 1
+            recipe_ingredient.save()
+
+        self.assert_etag_changes(edit_amount)
+
+    def test_errors_are_json(self):
+        response = self.anonymous_client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class IngredientSearchTest(APITestCase):
+    """Нечёткий поиск ингредиентов по индексу в памяти."""
+
+    url = '/api/ingredients/'
+
+    def search(self, query):
+        response = self.anonymous_client.get(self.url, {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_matches_first(self):
+        names = self.search('ингредиент 1')
+        self.assertEqual(names[:2], ['Ингредиент 1', 'Ингредиент 10'])
+
+    def test_typo(self):
+        self.assertIn('Ингредиент 3', self.search('ингридиент 3'))
+
+    @skipIf(
+        connection.vendor == 'postgresql',
+        'В PostgreSQL поиск выполняется по индексам pg_trgm в БД'
+    )
+    def test_served_without_queries(self):
+        self.search('ингредиент')
+        with self.assertNumQueries(0):
+            self.search('ингредиент 2')
+
+
+class CursorPaginationTest(APITestCase):
+    """Keyset-пагинация ленты по параметру cursor."""
+
+    url = '/api/recipes/'
+
+    def test_walks_feed(self):
+        names = []
+        response = self.anonymous_client.get(
+            self.url, {'cursor': '', 'limit': 5})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            names.extend(recipe['name'] for recipe in data['results'])
+            if data['next'] is None:
+                break
+            response = self.anonymous_client.get(data['next'])
+        self.assertEqual(
+            names, [recipe.name for recipe in reversed(self.recipes)])
+
+    def test_invalid_cursor(self):
+        cursors = ['!', 'bm90IGpzb24'] + [
+            urlsafe_b64encode(value.encode()).decode()
+            for value in ('[123, 1]', '[null, 1]', '[[], 1]', '[1]')
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.anonymous_client.get(
+                    self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    """Снимок токена в LRU процесса при локальном кэше."""
+
+    url = '/api/users/me/'
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.token_client = APIClient()
+        self.token_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_snapshot_without_password(self):
+        self.token_client.get(self.url)
+        self.assertEqual(
+            caches['auth_tokens'].get(
+                get_auth_token_cache_key(self.token.key)),
+            {'key': self.token.key, 'user_id': self.user.id,
+             'is_active': True}
+        )
+
+    def test_user_loaded_lazily(self):
+        self.token_client.get('/api/tags/')
+        # Токен не проверяется по БД, а пользователь не загружается,
+        # пока представлению не нужны его поля.
+        with self.assertNumQueries(0):
+            self.token_client.get('/api/tags/')
+        response = self.token_client.get(self.url)
+        self.assertEqual(response.json()['username'], self.user.username)
+
+    def test_logout(self):
+        self.token_client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.token_client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.token_client.get(self.url).status_code, 401)
+
+    def test_deactivation(self):
+        self.token_client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.token_client.get(self.url).status_code, 401)
+
+
+class ImageRenditionTest(APITestCase):
+    """Уменьшенные копии изображений при IMAGE_PROCESSING_EAGER."""
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.authorized_client.post(
+                '/api/recipes/', self.get_recipe_data(), format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(id=response.json()['id'])
+
+    def assert_files_exist(self, renditions, exist=True):
+        for rendition, name in renditions.items():
+            if rendition != 'source':
+                self.assertEqual(default_storage.exists(name), exist, name)
+
+    def test_renditions_created(self):
+        recipe = self.create_recipe()
+        renditions = recipe.image_renditions
+        self.assertEqual(renditions['source'], recipe.image.name)
+        self.assertEqual(
+            set(renditions) - {'source'},
+            set(settings.IMAGE_RENDITIONS['recipe'])
+        )
+        self.assert_files_exist(renditions)
+
+    def test_image_changed_during_processing(self):
+        recipe = self.create_recipe()
+        renditions = recipe.image_renditions
+        name = default_storage.save(
+            'recipe_images/replaced.png',
+            ContentFile(b64decode(IMAGE.split(',')[1]))
+        )
+        # Изображение рецепта сменилось, пока обрабатывался файл name.
+        with self.captureOnCommitCallbacks(execute=True):
+            create_renditions(Recipe, recipe.id, name)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_renditions, renditions)
+        self.assert_files_exist(renditions)
+        self.assert_files_exist({
+            rendition: get_rendition_path(name, rendition)
+            for rendition in settings.IMAGE_RENDITIONS['recipe']
+        }, exist=False)
+
+    def test_recipe_deleted(self):
+        recipe = self.create_recipe()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.authorized_client.delete(
+                f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_files_exist(recipe.image_renditions, exist=False)
+
+    def test_avatar_cleared(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.authorized_client.put(
+                '/api/users/me/avatar/', {'avatar': IMAGE}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        renditions = self.user.avatar_renditions
+        self.assertEqual(renditions['source'], self.user.avatar.name)
+        self.assert_files_exist(renditions)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.authorized_client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_renditions, {})
+        self.assert_files_exist(renditions, exist=False)
+
+    def test_new_size_falls_back_to_source(self):
+        field = Recipe._meta.get_field('image')
+        renditions = {
+            'source': 'recipe_images/test.png',
+            'thumbnail': 'renditions/recipe_images/test_thumbnail.webp',
+        }
+        urls = get_rendition_urls(
+            field, 'recipe_images/test.png', renditions, None)
+        self.assertEqual(
+            urls['thumbnail'],
+            field.storage.url('renditions/recipe_images/test_thumbnail.webp')
+        )
+        self.assertEqual(
+            urls['card'], field.storage.url('recipe_images/test.png'))
@@ -1,5 +1,3 @@
-import csv
-from io import StringIO
 from pathlib import Path
 from uuid import uuid4
 
@@ -7,40 +5,27 @@ from django.conf import settings
 from hashids import Hashids
 
 
+hashids = Hashids(min_length=int(settings.SHORT_LINK_MIN_LENGTH))
+
+
 def generate_short_link(obj_id):
     """Генерация короткой ссылки."""
-    hashids = Hashids(min_length=settings.SHORT_LINK_MIN_LENGTH)
     return hashids.encode(obj_id)
 
 
-def generate_shopping_cart_file(recipes_ingredients):
-    """Генерация файла списка покупок."""
-    ingredient_dict = {}
-    for recipe_ingredient in recipes_ingredients:
-        ingredient_name = recipe_ingredient.ingredient.name
-        amount = recipe_ingredient.amount
-        measurement_unit = recipe_ingredient.ingredient.measurement_unit
-        if ingredient_name in ingredient_dict:
-            ingredient_dict[ingredient_name]['amount'] += amount
-        else:
-            ingredient_dict[ingredient_name] = {
-                'ingredient': ingredient_name,
-                'amount': amount,
-                'measurement_unit': measurement_unit
-            }
-    ingredients = list(ingredient_dict.values())
-
-    output = StringIO()
-    writer = csv.writer(output, delimiter=',')
-    writer.writerow(['Ингредиент', 'Количество', 'Ед. измерения'])
-    for ingredient in ingredients:
-        writer.writerow([
-            ingredient['ingredient'],
-            ingredient['amount'],
-            ingredient['measurement_unit']
-        ])
-    output.seek(0)
-    return output.getvalue()
+def decode_short_link(short_link):
+    """Id объекта по короткой ссылке или None для чужой ссылки."""
+    numbers = hashids.decode(short_link)
+    if len(numbers) != 1:
+        return None
+    return numbers[0]
+
+
+def get_recipes_limit(recipes_limit):
+    """Приведение параметра recipes_limit к числу."""
+    if str(recipes_limit).isdigit():
+        return int(recipes_limit)
+    return settings.DEFAULT_RECIPES_LIMIT
 
 
 def avatar_upload_path(instance, filename):
@@ -1,7 +1,17 @@
+from hashlib import md5
+from time import monotonic
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Exists, OuterRef
-from django.http import HttpResponse
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import (Count, Exists, OuterRef, Prefetch, Subquery,
+                              Sum)
+from django.http import (Http404, HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -16,16 +26,22 @@ from cookbook.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                              ShoppingCart, Tag)
 from users.models import Subscription
 
+from .cache import (TAGS_VERSION_KEY, get_recipe_representations,
+                    get_recipes_page_cache_key, get_shopping_cart_ingredients,
+                    get_shopping_cart_version, get_short_link_recipe_id,
+                    get_version)
 from .filters import IngredientFilter, RecipeFilter
 from .paginators import CustomPagination
 from .permissions import IsAuthenticatedAuthor
+from .renderers import SHOPPING_CART_RENDERERS, ORJSONRenderer
+from .search import ingredient_index
 from .serializers import (AvatarSerializer, ExtendedUserSerializer,
                           FavoriteSerializer, GetRecipesSerializer,
                           IngredientSerializer, RecipeSerializer,
                           ShoppingCartSerializer, ShortLinkSerializer,
                           ShortRecipeInfoSerializer, SubscriptionSerializer,
-                          TagSerializer)
-from .utils import generate_shopping_cart_file, generate_short_link
+                          TagSerializer, build_recipe_representations)
+from .utils import get_recipes_limit
 
 
 User = get_user_model()
@@ -36,6 +52,7 @@ class CustomUserVIewSet(UserViewSet):
 
     pagination_class = CustomPagination
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('id',)
 
     def get_permissions(self):
         if self.action == 'retrieve':
@@ -44,6 +61,15 @@ class CustomUserVIewSet(UserViewSet):
             return [AllowAny()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    follower=user, following=OuterRef('pk'))))
+        return queryset
+
     @action(detail=False, methods=['put', 'delete'],
             url_path='me/avatar')
     def create_destroy_avatar(self, request):
@@ -102,12 +128,25 @@ class CustomUserVIewSet(UserViewSet):
     def get_subscriptions(self, request):
         subscriptions = request.user.followers.values_list(
             'following_id', flat=True)
-        followings_queryset = User.objects.filter(
+        recipes_limit = get_recipes_limit(
+            request.query_params.get('recipes_limit'))
+        # Не более recipes_limit последних рецептов каждого автора
+        # загружаются одним запросом для всей страницы. Порядок задан
+        # явно: срез подзапроса не должен зависеть от Meta.ordering,
+        # а id разрешает совпадения created_at.
+        latest_recipes = Recipe.objects.filter(id__in=Subquery(
+            Recipe.objects.filter(
+                author_id=OuterRef('author_id')
+            ).order_by('-created_at', '-id').values('id')[:recipes_limit]
+        )).order_by('-created_at', '-id')
+        followings_queryset = self.get_queryset().filter(
             id__in=subscriptions
-        ).annotate(recipes_count=Count('recipes'))
+        ).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('id').prefetch_related(
+            Prefetch('recipes', queryset=latest_recipes))
         paginated_followings = self.paginate_queryset(
             followings_queryset)
-        recipes_limit = request.query_params.get('recipes_limit')
         serializer = ExtendedUserSerializer(
             paginated_followings,
             many=True,
@@ -123,6 +162,43 @@ class TagViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    # (версия каталога, время сборки, JSON-ответ, ETag),
+    # общий для запросов процесса.
+    payload = None
+
+    @staticmethod
+    def is_stale(payload, version):
+        # Срок жизни страхует от пропущенного сброса версии, например
+        # при локальном кэше в нескольких процессах.
+        return (
+            payload is None
+            or payload[0] != version
+            or monotonic() - payload[1] > settings.TAGS_PAYLOAD_TIMEOUT
+        )
+
+    def get_payload(self):
+        version = get_version(TAGS_VERSION_KEY)
+        payload = TagViewSet.payload
+        if self.is_stale(payload, version):
+            content = ORJSONRenderer().render(
+                self.get_serializer(self.get_queryset(), many=True).data)
+            payload = (
+                version, monotonic(), content,
+                quote_etag(md5(content).hexdigest())
+            )
+            TagViewSet.payload = payload
+        return payload
+
+    def list(self, request, *args, **kwargs):
+        _, _, content, etag = self.get_payload()
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content, content_type=ORJSONRenderer.media_type)
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
 
 
 class IngredientViewSet(ReadOnlyModelViewSet):
@@ -135,6 +211,22 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        # Автодополнение и нечёткий поиск вне PostgreSQL обслуживаются
+        # индексом в памяти, без запросов к БД.
+        search = request.query_params.get('search')
+        if search:
+            if connection.vendor == 'postgresql':
+                # Те же словари, что и у индекса, без сериализатора.
+                queryset = self.filter_queryset(self.get_queryset())
+                return Response(list(
+                    queryset.values('id', 'name', 'measurement_unit')))
+            return Response(ingredient_index.rank(search))
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return Response(ingredient_index.all())
+
 
 class RecipeViewSet(ModelViewSet):
     """ViewSet рецептов."""
@@ -143,6 +235,7 @@ class RecipeViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    cursor_ordering = ('-created_at', '-id')
 
     def get_permissions(self):
         if self.action == 'retrieve':
@@ -159,8 +252,7 @@ class RecipeViewSet(ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Recipe.objects.select_related('author').prefetch_related(
-            'tags', 'recipeingredient__ingredient')
+        queryset = Recipe.objects.all()
         if user.is_authenticated:
             queryset = queryset.annotate(
                 is_favorited=Exists(Favorite.objects.filter(
@@ -174,17 +266,102 @@ class RecipeViewSet(ModelViewSet):
             return GetRecipesSerializer
         return RecipeSerializer
 
-    def perform_create(self, serializer):
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return self.get_list_response()
+        return self.get_cached_response(
+            get_recipes_page_cache_key(request), self.get_list_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return self.get_retrieve_response()
+        return self.get_cached_response(
+            get_recipes_page_cache_key(request, recipe_id=kwargs['pk']),
+            self.get_retrieve_response
+        )
+
+    def get_list_response(self):
+        queryset = self.filter_queryset(self.get_queryset()).only(
+            'id', 'author_id', 'created_at')
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.get_personalized_data(queryset))
+        return self.get_paginated_response(self.get_personalized_data(page))
+
+    def get_retrieve_response(self):
+        return Response(self.get_personalized_data([self.get_object()])[0])
+
+    def get_personalized_data(self, recipes):
+        """
+        Представления рецептов с флагами текущего пользователя.
+
+        Общая для всех часть берётся из кэша по версии рецепта, а флаги
+        is_favorited, is_in_shopping_cart и author.is_subscribed
+        подставляются из аннотаций страницы и одного запроса подписок.
+        """
+        recipes = list(recipes)
+        representations = get_recipe_representations(
+            self.request, [recipe.id for recipe in recipes],
+            self.serialize_recipes
+        )
         user = self.request.user
-        recipe = serializer.save(author=user)
-        return recipe
+        following_ids = set()
+        if user.is_authenticated:
+            following_ids = set(user.followers.filter(
+                following_id__in={recipe.author_id for recipe in recipes}
+            ).values_list('following_id', flat=True))
+        data = []
+        for recipe in recipes:
+            representation = representations.get(recipe.id)
+            if representation is None:
+                continue
+            representation['is_favorited'] = getattr(
+                recipe, 'is_favorited', False)
+            representation['is_in_shopping_cart'] = getattr(
+                recipe, 'is_in_shopping_cart', False)
+            representation['author']['is_subscribed'] = (
+                recipe.author_id in following_ids)
+            data.append(representation)
+        return data
+
+    def serialize_recipes(self, recipe_ids):
+        return build_recipe_representations(recipe_ids, self.request)
+
+    def get_cached_response(self, key, get_response):
+        """
+        Ответ для анонимных пользователей из кэша.
+
+        Данные одинаковы для всех анонимных посетителей, поэтому кэшируются
+        по ключу с версией, а ETag и Cache-Control позволяют браузеру
+        и nginx не запрашивать неизменившийся ответ повторно.
+        """
+        etag = quote_etag(key)
+        if etag in parse_etags(self.request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            payloads = caches['payloads']
+            data = payloads.get(key)
+            if data is None:
+                response = get_response()
+                if response.status_code != HTTP_200_OK:
+                    return response
+                payloads.set(
+                    key, response.data, settings.RECIPES_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.RECIPES_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def perform_create(self, serializer):
+        # Кэш рецептов сбрасывается обработчиками сигналов api.signals.
+        serializer.save(author=self.request.user)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_short_link(self, request, pk):
         recipe = self.get_object()
-        if not recipe.short_link:
-            recipe.short_link = generate_short_link(recipe.id)
-            recipe.save()
         serializer = ShortLinkSerializer(recipe)
         return Response(serializer.data, HTTP_200_OK)
 
@@ -225,17 +402,35 @@ class RecipeViewSet(ModelViewSet):
             # В случае неуспешного удаления возвращаем 400
             return Response(status=HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=['get'], url_path='download_shopping_cart')
+    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+            renderer_classes=SHOPPING_CART_RENDERERS)
     def download_shopping_cart(self, request):
         user = request.user
-        shopping_cart = ShoppingCart.objects.filter(user=user)
-        recipes_ingredients = RecipeIngredient.objects.filter(
-            recipe__in=shopping_cart.values('recipe')
-        ).select_related('ingredient', 'recipe')
-        csv_file = generate_shopping_cart_file(recipes_ingredients)
-        response = HttpResponse(csv_file, content_type='text/csv')
+        renderer = request.accepted_renderer
+        version = get_shopping_cart_version(user.id)
+        etag = quote_etag(f'{version}-{renderer.format}')
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        ingredients = RecipeIngredient.objects.filter(
+            recipe__shopping_carts__user=user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        ingredients = get_shopping_cart_ingredients(
+            user.id, version, ingredients)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients), content_type=content_type)
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.csv"')
+            f'attachment; filename="shopping_cart.{renderer.format}"')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
 
 
@@ -243,5 +438,7 @@ class ShortLinkRedirectView(View):
     """Представление обработки коротких ссылок рецептов."""
 
     def get(self, request, short_link):
-        recipe = get_object_or_404(Recipe, short_link=short_link)
-        return redirect('recipe-detail', pk=recipe.id)
+        recipe_id = get_short_link_recipe_id(short_link)
+        if recipe_id is None:
+            raise Http404('Рецепт не найден')
+        return redirect('recipe-detail', pk=recipe_id)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.utils import generate_short_link
+from cookbook.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Fill in missing recipe short links in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of recipes updated per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            recipes = list(
+                Recipe.objects.filter(
+                    short_link__isnull=True, id__gt=last_id
+                ).order_by('id').only('id')[:batch_size]
+            )
+            if not recipes:
+                break
+            for recipe in recipes:
+                recipe.short_link = generate_short_link(recipe.id)
+            Recipe.objects.bulk_update(recipes, ('short_link',))
+            last_id = recipes[-1].id
+            total += len(recipes)
+            self.stdout.write(f'Обновлено рецептов: {total}')
+        self.stdout.write(
+            self.style.SUCCESS(f'Короткие ссылки заполнены: {total}'))
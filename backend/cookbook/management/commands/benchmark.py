@@ -0,0 +1,429 @@
+from pathlib import Path
+from random import Random
+from statistics import median, quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.mixins import ListModelMixin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.authentication import CachedTokenAuthentication
+from api.cache import is_shared_cache
+from api.filters import RecipeFilter
+from api.renderers import SHOPPING_CART_RENDERERS, ORJSONRenderer
+from api.search import ingredient_index
+from api.serializers import (GetRecipesSerializer,
+                             build_recipe_representations)
+from api.views import IngredientViewSet
+from cookbook.models import (Ingredient, Recipe, RecipeIngredient,
+                             ShoppingCart, Tag)
+
+
+User = get_user_model()
+
+BENCHMARK_PREFIX = 'benchmark_'
+
+
+class PrefixIngredientViewSet(IngredientViewSet):
+    """Исходный список ингредиентов: istartswith в БД через фильтр."""
+
+    def list(self, request, *args, **kwargs):
+        return ListModelMixin.list(self, request, *args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a performance benchmark scenario; the data it creates is '
+        'rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario', choices=[
+                name[len(BENCHMARK_PREFIX):] for name in dir(self)
+                if name.startswith(BENCHMARK_PREFIX)
+            ],
+            help='Scenario to run')
+        parser.add_argument(
+            '--recipes', type=int,
+            help='Number of recipes to create (500 for shopping_cart, '
+                 '100000 for tag_filter)')
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Minimal size of the ingredient catalog')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=10,
+            help='Number of ingredients in each recipe')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of measured runs of each variant')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed for a reproducible dataset')
+        parser.add_argument(
+            '--catalog', default='data/ingredients.json',
+            help='Ingredient catalog loaded when the database has fewer '
+                 'ingredients')
+
+    def handle(self, *args, **options):
+        self.rng = Random(options['seed'])
+        self.repeat = options['repeat']
+        # Все созданные для замеров данные откатываются.
+        with transaction.atomic():
+            getattr(self, BENCHMARK_PREFIX + options['scenario'])(**options)
+            transaction.set_rollback(True)
+
+    def measure(self, func):
+        """Медианное время выполнения func в секундах и её результат."""
+        timings = []
+        for _ in range(self.repeat):
+            started_at = perf_counter()
+            result = func()
+            timings.append(perf_counter() - started_at)
+        return median(timings), result
+
+    def measure_latencies(self, func, arguments):
+        """Время каждого вызова func(argument) в секундах."""
+        timings = []
+        for _ in range(self.repeat):
+            for argument in arguments:
+                started_at = perf_counter()
+                func(argument)
+                timings.append(perf_counter() - started_at)
+        return timings
+
+    def write_latencies(self, title, timings):
+        percentiles = quantiles(timings, n=100)
+        self.stdout.write(
+            f'{title:>24}: p50 {percentiles[49] * 1000:7.2f} мс, '
+            f'p95 {percentiles[94] * 1000:7.2f} мс'
+        )
+
+    def create_ingredients(self, count):
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'Ингредиент для замеров {index}',
+                        measurement_unit='г'
+                    )
+                    for index in range(missing)
+                ),
+                ignore_conflicts=True
+            )
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def load_catalog(self, path):
+        catalog = Path(path)
+        if Ingredient.objects.count() < 1000 and catalog.exists():
+            call_command('load_ingredients', str(catalog), stdout=self.stdout)
+
+    def create_recipes(self, author, count, ingredient_ids, per_recipe):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'Рецепт {index}',
+                image='recipe_images/benchmark.png', text='Описание',
+                cooking_time=10
+            )
+            for index in range(count)
+        )
+        recipe_ids = list(
+            Recipe.objects.filter(author=author).values_list('id', flat=True))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.rng.sample(ingredient_ids, per_recipe)
+        )
+        return recipe_ids
+
+    def create_recipes_page(self, ingredient_ids, **options):
+        """Страница ленты: рецепты одного автора с двумя тегами."""
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com',
+            first_name='Имя', last_name='Фамилия'
+        )
+        tag_ids = [
+            Tag.objects.create(
+                name=f'Тег для замеров {index}', slug=f'benchmark-{index}'
+            ).id
+            for index in range(3)
+        ]
+        recipe_ids = self.create_recipes(
+            author, settings.REST_FRAMEWORK['PAGE_SIZE'], ingredient_ids,
+            options['ingredients_per_recipe']
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in tag_ids[:2]
+        )
+        return recipe_ids
+
+    def benchmark_shopping_cart(self, **options):
+        """Пропускная способность рендереров списка покупок."""
+        user = User.objects.create(
+            username='benchmark', email='benchmark@example.com',
+            first_name='Имя', last_name='Фамилия'
+        )
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        recipe_ids = self.create_recipes(
+            user, options['recipes'] or 500, ingredient_ids,
+            options['ingredients_per_recipe']
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        )
+        # Тот же запрос, что и в download_shopping_cart.
+        queryset = RecipeIngredient.objects.filter(
+            recipe__shopping_carts__user=user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        elapsed, rows = self.measure(lambda: list(queryset.all()))
+        self.stdout.write(
+            f'Рецептов в списке: {len(recipe_ids)}, строк: {len(rows)}, '
+            f'агрегация: {elapsed * 1000:.1f} мс'
+        )
+        for renderer_class in SHOPPING_CART_RENDERERS:
+            renderer = renderer_class()
+
+            def render():
+                # Ответ кодирует фрагменты так же, как при отдаче файла.
+                response = StreamingHttpResponse(renderer.stream(rows))
+                return sum(len(chunk) for chunk in response)
+
+            elapsed, size = self.measure(render)
+            self.stdout.write(
+                f'{renderer.format:>5}: {elapsed * 1000:8.1f} мс, '
+                f'{len(rows) / elapsed:10.0f} строк/с, '
+                f'{size / 1024:8.1f} КБ'
+            )
+
+    def benchmark_ingredient_search(self, **options):
+        """
+        Задержка нечёткого поиска ингредиентов и поиска по префиксу.
+
+        Запросы — префиксы названий из каталога и они же с опечаткой.
+        """
+        self.load_catalog(options['catalog'])
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        prefixes = [
+            name[:self.rng.randint(3, 6)]
+            for name in self.rng.sample(names, min(50, len(names)))
+        ]
+        typos = []
+        for prefix in prefixes:
+            position = self.rng.randrange(1, len(prefix))
+            typos.append(prefix[:position] + 'а' + prefix[position + 1:])
+        factory = RequestFactory()
+
+        def get_view(viewset, parameter):
+            view = viewset.as_view({'get': 'list'})
+
+            def call(query):
+                response = view(factory.get(
+                    '/api/ingredients/', {parameter: query}))
+                return response.render().content
+
+            return call
+
+        prefix_query = get_view(PrefixIngredientViewSet, 'name')
+        search = get_view(IngredientViewSet, 'search')
+        # Первый вызов строит индекс ингредиентов в памяти.
+        search(prefixes[0])
+        self.stdout.write(
+            f'Ингредиентов: {len(names)}, запросов: {len(prefixes)} '
+            f'x {self.repeat}'
+        )
+        for title, func, queries in (
+            ('Префикс (istartswith)', prefix_query, prefixes),
+            ('Ранжированный поиск', search, prefixes),
+            ('С опечаткой', search, typos),
+        ):
+            self.write_latencies(
+                title, self.measure_latencies(func, queries))
+
+    def benchmark_tag_filter(self, **options):
+        """
+        Фильтрация ленты по тегам: JOIN с DISTINCT против EXISTS.
+
+        Замеряются первая страница ленты и подсчёт для пагинатора.
+        """
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com',
+            first_name='Имя', last_name='Фамилия'
+        )
+        tag_ids = [
+            Tag.objects.create(
+                name=f'Тег для замеров {index}', slug=f'benchmark-{index}'
+            ).id
+            for index in range(10)
+        ]
+        recipe_ids = self.create_recipes(
+            author, options['recipes'] or 100000, [], 0)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(tag_ids, 2)
+        )
+        slugs = list(
+            Tag.objects.filter(id__in=tag_ids).values_list('slug', flat=True))
+        # Те же поля, что выбирает список рецептов.
+        queryset = Recipe.objects.only('id', 'author_id', 'created_at')
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        self.stdout.write(
+            f'Рецептов: {len(recipe_ids)}, тегов: {len(tag_ids)}, '
+            f'по 2 на рецепт'
+        )
+        for tags in (slugs[:1], slugs[:3]):
+            request = Request(
+                RequestFactory().get('/api/recipes/', {'tags': tags}))
+            variants = (
+                ('DISTINCT', queryset.filter(tags__slug__in=tags).distinct()),
+                ('EXISTS', RecipeFilter(
+                    request.query_params, queryset=queryset, request=request
+                ).qs),
+            )
+            self.stdout.write(f'Тегов в фильтре: {len(tags)}')
+            for title, filtered in variants:
+                page_elapsed, page = self.measure(
+                    lambda: list(filtered.all()[:page_size]))
+                count_elapsed, count = self.measure(filtered.count)
+                self.stdout.write(
+                    f'{title:>9}: страница {page_elapsed * 1000:8.1f} мс, '
+                    f'count {count_elapsed * 1000:8.1f} мс ({count})'
+                )
+
+    def benchmark_json_renderer(self, **options):
+        """
+        Время рендеринга orjson против стандартного JSONRenderer DRF.
+
+        Данные — страница ленты из шести рецептов и весь список
+        ингредиентов без пагинации.
+        """
+        self.load_catalog(options['catalog'])
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        recipe_ids = self.create_recipes_page(ingredient_ids, **options)
+        request = Request(RequestFactory().get('/api/recipes/'))
+        representations = build_recipe_representations(recipe_ids, request)
+        page = {
+            'count': len(recipe_ids),
+            'next': None,
+            'previous': None,
+            'results': [
+                representations[recipe_id] for recipe_id in recipe_ids],
+        }
+        for title, data, number in (
+            ('Страница рецептов', page, 1000),
+            (f'Ингредиенты ({len(ingredient_ids)})',
+             ingredient_index.all(), 20),
+        ):
+            self.stdout.write(title)
+            for renderer in (JSONRenderer(), ORJSONRenderer()):
+
+                def render():
+                    for _ in range(number):
+                        content = renderer.render(data)
+                    return content
+
+                elapsed, content = self.measure(render)
+                self.stdout.write(
+                    f'{type(renderer).__name__:>15}: '
+                    f'{elapsed / number * 1e6:9.1f} мкс, '
+                    f'{len(content) / 1024:8.1f} КБ'
+                )
+
+    def benchmark_recipe_serialization(self, **options):
+        """
+        Сериализация страницы ленты: build_recipe_representations против
+        GetRecipesSerializer на тех же рецептах, без кэша представлений.
+        """
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        recipe_ids = self.create_recipes_page(ingredient_ids, **options)
+        request = Request(RequestFactory().get('/api/recipes/'))
+        number = 200
+
+        recipes = Recipe.objects.filter(id__in=recipe_ids).order_by('id')
+
+        def serialize(queryset=recipes):
+            return GetRecipesSerializer(
+                queryset.all(), many=True, context={'request': request}
+            ).data
+
+        def serialize_prefetched():
+            return serialize(recipes.select_related('author').prefetch_related(
+                'tags', 'recipeingredient__ingredient'))
+
+        def build():
+            representations = build_recipe_representations(
+                recipe_ids, request)
+            return [representations[recipe_id] for recipe_id in recipe_ids]
+
+        self.stdout.write(f'Страница из {len(recipe_ids)} рецептов')
+        for title, func in (
+            ('GetRecipesSerializer', serialize),
+            ('с prefetch_related', serialize_prefetched),
+            ('build_recipe_representations', build),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+
+            def run():
+                for _ in range(number):
+                    func()
+
+            elapsed, _ = self.measure(run)
+            self.stdout.write(
+                f'{title:>28}: {elapsed / number * 1e6:9.1f} мкс, '
+                f'{len(queries)} SQL'
+            )
+
+    def benchmark_auth(self, **options):
+        """
+        Накладные расходы авторизации по токену на один запрос.
+
+        Сравниваются TokenAuthentication и CachedTokenAuthentication
+        с настроенным бэкендом кэша; при локальном кэше снимки токенов
+        хранятся в LRU процесса.
+        """
+        user = User.objects.create(
+            username='benchmark', email='benchmark@example.com',
+            first_name='Имя', last_name='Фамилия'
+        )
+        token = Token.objects.create(user=user)
+        request = RequestFactory().get(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.stdout.write(
+            f'Бэкенд кэша: {settings.CACHES["default"]["BACKEND"]}, '
+            f'общий: {"да" if is_shared_cache() else "нет"}'
+        )
+        for authentication in (
+            TokenAuthentication(), CachedTokenAuthentication()
+        ):
+            # Первый вызов заполняет кэш.
+            authentication.authenticate(request)
+            with CaptureQueriesContext(connection) as queries:
+                authentication.authenticate(request)
+            self.write_latencies(
+                f'{type(authentication).__name__} ({len(queries)} SQL)',
+                self.measure_latencies(
+                    authentication.authenticate, [request] * 200)
+            )
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.filters import RecipeFilter
+from cookbook.models import Recipe, Tag
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN ANALYZE on the canonical recipe feed queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='User id for the favorites and shopping cart filters')
+        parser.add_argument(
+            '--author', type=int, help='Author id for the author filter')
+        parser.add_argument(
+            '--tags', nargs='+', help='Tag slugs for the tags filter')
+
+    def get_feed_queries(self, user, author, tags):
+        queries = {
+            'Лента рецептов': {},
+            'Фильтр по автору': {'author': author},
+            'Фильтр по тегам': {'tags': tags},
+        }
+        if user.is_authenticated:
+            queries['Избранное'] = {'is_favorited': 1}
+            queries['Список покупок'] = {'is_in_shopping_cart': 1}
+        return queries
+
+    def get_page(self, user, params):
+        params = {key: value for key, value in params.items() if value}
+        request = Request(RequestFactory().get('/api/recipes/', params))
+        request.user = user
+        queryset = RecipeFilter(
+            request.query_params,
+            queryset=Recipe.objects.all(),
+            request=request
+        ).qs
+        return queryset[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+
+    def handle(self, *args, **options):
+        user = AnonymousUser()
+        if options['user']:
+            try:
+                user = User.objects.get(id=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(
+                    f'Пользователь с id {options["user"]} не найден')
+        author = options['author'] or (
+            Recipe.objects.values_list('author_id', flat=True).first())
+        tags = options['tags'] or list(
+            Tag.objects.values_list('slug', flat=True)[:2])
+        # ANALYZE поддерживается только PostgreSQL.
+        explain_options = (
+            {'analyze': True} if connection.vendor == 'postgresql' else {})
+
+        queries = self.get_feed_queries(user, author, tags)
+        for title, params in queries.items():
+            queryset = self.get_page(user, params)
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options) + '\n')
@@ -1,34 +1,138 @@
+import csv
 import json
+from itertools import islice
+from pathlib import Path
+from time import monotonic
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from api.cache import invalidate_ingredients, is_shared_cache
 from cookbook.models import Ingredient
 
 
+def iter_json_items(file, chunk_size=64 * 1024):
+    """
+    Потоковое чтение JSON-массива объектов.
+
+    Файл читается блоками по chunk_size символов, в памяти держится
+    только ещё не разобранный хвост, а не весь документ.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = finished = False
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer += chunk
+        while not finished:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise ValueError('Ожидался JSON-массив')
+                buffer = buffer[1:]
+                started = True
+                continue
+            buffer = buffer.lstrip(', \t\r\n')
+            if not buffer:
+                break
+            if buffer[0] == ']':
+                finished = True
+                break
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Объект ещё не прочитан целиком.
+                break
+            buffer = buffer[end:]
+            yield item
+    if not finished:
+        raise ValueError('Некорректный или незавершённый JSON-массив')
+
+
+def iter_json_ingredients(file):
+    for item in iter_json_items(file):
+        yield item['name'], item['measurement_unit']
+
+
+def iter_csv_ingredients(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {
+    'json': iter_json_ingredients,
+    'csv': iter_csv_ingredients,
+}
+
+
 class Command(BaseCommand):
-    help = 'Load ingredients from a JSON file'
+    help = 'Load ingredients from a JSON or CSV file, skipping existing ones'
 
     def add_arguments(self, parser):
         parser.add_argument(
-            'file_path', type=str, help='Path to the JSON file')
+            'file_path', type=str, help='Path to the JSON or CSV file')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='File format, detected by extension by default')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of ingredients inserted per query')
 
     def handle(self, *args, **kwargs):
-        file_path = kwargs['file_path']
+        file_path = Path(kwargs['file_path'])
+        file_format = kwargs['format'] or file_path.suffix.lstrip('.')
+        batch_size = kwargs['batch_size']
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
+            reader = READERS[file_format]
+        except KeyError:
+            self.stderr.write(self.style.ERROR(
+                f'Неизвестный формат файла: {file_format}'))
+            return
 
-            ingredients = [
-                Ingredient(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit']
+        try:
+            started_at = monotonic()
+            processed = 0
+            initial_count = Ingredient.objects.count()
+            with open(file_path, 'r', encoding='utf-8', newline='') as file, \
+                    transaction.atomic():
+                ingredients = (
+                    Ingredient(
+                        name=name.strip(),
+                        measurement_unit=measurement_unit.strip()
+                    )
+                    for name, measurement_unit in reader(file)
                 )
-                for item in data
-            ]
-            Ingredient.objects.bulk_create(ingredients)
+                while True:
+                    batch = list(islice(ingredients, batch_size))
+                    if not batch:
+                        break
+                    # Уже загруженные ингредиенты пропускаются
+                    # уникальным ограничением (name, measurement_unit).
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                    processed += len(batch)
+                    elapsed = monotonic() - started_at
+                    self.stdout.write(
+                        f'Обработано строк: {processed} '
+                        f'({processed / max(elapsed, 0.001):.0f} строк/с)'
+                    )
+            created = Ingredient.objects.count() - initial_count
+            invalidate_ingredients()
+            if not is_shared_cache():
+                # Версия сбрасывается только в кэше этой команды.
+                self.stdout.write(self.style.WARNING(
+                    'Кэш не общий (CACHE_BACKEND): запущенные процессы '
+                    'увидят новые ингредиенты через '
+                    'INGREDIENT_INDEX_TIMEOUT или после перезапуска'
+                ))
 
-            self.stdout.write(self.style.SUCCESS('Данные успешно загружены!'))
+            self.stdout.write(self.style.SUCCESS(
+                f'Данные успешно загружены! Добавлено ингредиентов: '
+                f'{created}, пропущено существующих: {processed - created}'
+            ))
 
         except Exception as e:
             self.stderr.write(self.style.ERROR(f'Ошибка загрузки данных: {e}'))
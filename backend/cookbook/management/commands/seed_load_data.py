@@ -0,0 +1,252 @@
+import csv
+import json
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import islice
+from random import Random
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from api.cache import invalidate_recipes, is_shared_cache
+from cookbook.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                             ShoppingCart, Tag)
+from users.models import Subscription
+
+
+User = get_user_model()
+
+SEED_IMAGE_NAME = 'recipe_images/seed.png'
+SEED_PASSWORD = 'load-test-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate users, recipes, subscriptions, favorites and shopping '
+        'carts for load testing; --recipes 100000 gives 1M recipe '
+        'ingredients with the default settings'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Number of users to create')
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='Number of recipes to create')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=10,
+            help='Number of ingredients in each recipe')
+        parser.add_argument(
+            '--tags-per-recipe', type=int, default=2,
+            help='Number of tags of each recipe')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Number of subscriptions of each user')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Number of favorite recipes of each user')
+        parser.add_argument(
+            '--shopping-cart', type=int, default=5,
+            help='Number of recipes in the shopping cart of each user')
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Number of rows inserted per query')
+        parser.add_argument(
+            '--seed', type=int, help='Random seed for a reproducible dataset')
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Prefix of generated usernames')
+
+    def handle(self, *args, **options):
+        self.rng = Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # COPY быстрее bulk_create в разы, но есть только в PostgreSQL.
+        self.use_copy = connection.vendor == 'postgresql'
+        prefix = f'{options["prefix"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже существуют')
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if len(ingredient_ids) < options['ingredients_per_recipe']:
+            raise CommandError(
+                'Недостаточно ингредиентов, загрузите их командой '
+                'load_ingredients')
+        tag_ids = self.get_tag_ids(options['tags_per_recipe'])
+
+        started_at = monotonic()
+        with transaction.atomic():
+            user_ids = self.create_users(prefix, options['users'])
+            recipe_ids = self.create_recipes(
+                prefix, user_ids, options['recipes'])
+            self.insert(Recipe.tags.through, (
+                {'recipe_id': recipe_id, 'tag_id': tag_id}
+                for recipe_id in recipe_ids
+                for tag_id in self.sample(
+                    tag_ids, options['tags_per_recipe'])
+            ))
+            self.insert(RecipeIngredient, (
+                {
+                    'recipe_id': recipe_id,
+                    'ingredient_id': ingredient_id,
+                    'amount': self.rng.randint(1, 500),
+                }
+                for recipe_id in recipe_ids
+                for ingredient_id in self.sample(
+                    ingredient_ids, options['ingredients_per_recipe'])
+            ))
+            self.insert(Subscription, (
+                {'follower_id': follower_id, 'following_id': following_id}
+                for follower_id in user_ids
+                for following_id in [
+                    user_id for user_id in self.sample(
+                        user_ids, options['subscriptions'] + 1)
+                    if user_id != follower_id
+                ][:options['subscriptions']]
+            ))
+            for model, per_user in (
+                (Favorite, options['favorites']),
+                (ShoppingCart, options['shopping_cart']),
+            ):
+                self.insert(model, (
+                    {'user_id': user_id, 'recipe_id': recipe_id}
+                    for user_id in user_ids
+                    for recipe_id in self.sample(recipe_ids, per_user)
+                ))
+        call_command('backfill_short_links', batch_size=self.batch_size)
+        invalidate_recipes()
+        if not is_shared_cache():
+            # Версия ленты сбрасывается только в кэше этой команды.
+            self.stdout.write(self.style.WARNING(
+                'Кэш не общий (CACHE_BACKEND): запущенные процессы '
+                'покажут новые рецепты анонимным пользователям через '
+                'RECIPES_CACHE_TIMEOUT или после перезапуска'
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {monotonic() - started_at:.1f} с'))
+
+    def sample(self, population, count):
+        return self.rng.sample(population, min(count, len(population)))
+
+    def get_tag_ids(self, count):
+        tag_ids = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        if len(tag_ids) < count:
+            Tag.objects.bulk_create(
+                Tag(name=f'Тег {index}', slug=f'load-tag-{index}')
+                for index in range(len(tag_ids), count)
+            )
+            tag_ids = list(
+                Tag.objects.order_by('id').values_list('id', flat=True))
+        return tag_ids
+
+    def get_image_name(self):
+        """Одно общее изображение для всех рецептов."""
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.exists(SEED_IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (600, 400), (230, 180, 120)).save(
+                buffer, format='PNG')
+            storage.save(SEED_IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return SEED_IMAGE_NAME
+
+    def create_users(self, prefix, count):
+        # Хеш пароля считается один раз: это самая медленная часть.
+        password = make_password(SEED_PASSWORD)
+        now = timezone.now()
+        self.insert(User, (
+            {
+                'password': password,
+                'last_login': None,
+                'is_superuser': False,
+                'username': f'{prefix}{index}',
+                'first_name': f'Имя {index}',
+                'last_name': f'Фамилия {index}',
+                'email': f'{prefix}{index}@example.com',
+                'is_staff': False,
+                'is_active': True,
+                'date_joined': now,
+                'avatar': None,
+                'avatar_renditions': {},
+            }
+            for index in range(count)
+        ))
+        return list(
+            User.objects.filter(
+                username__startswith=prefix
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipes(self, prefix, user_ids, count):
+        image = self.get_image_name()
+        now = timezone.now()
+        # bulk_create заменяет created_at текущим временем (auto_now_add),
+        # разнесённые по времени даты сохраняются только через COPY.
+        self.insert(Recipe, (
+            {
+                'name': f'Рецепт {index}',
+                'image': image,
+                'image_renditions': {},
+                'text': f'Описание рецепта {index}',
+                'cooking_time': self.rng.randint(1, 180),
+                'author_id': self.rng.choice(user_ids),
+                'short_link': None,
+                'created_at': now - timedelta(minutes=index),
+            }
+            for index in range(count)
+        ))
+        return list(
+            Recipe.objects.filter(
+                author__username__startswith=prefix
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    def insert(self, model, rows):
+        """Пакетная вставка строк-словарей с атрибутами модели."""
+        started_at = monotonic()
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            if self.use_copy:
+                self.copy(model, batch)
+            else:
+                model.objects.bulk_create(model(**row) for row in batch)
+            total += len(batch)
+        elapsed = max(monotonic() - started_at, 0.001)
+        self.stdout.write(
+            f'{model._meta.db_table}: {total} строк '
+            f'({total / elapsed:.0f} строк/с)'
+        )
+
+    def copy(self, model, rows):
+        columns = {
+            field.attname: field.column
+            for field in model._meta.concrete_fields
+        }
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(
+                json.dumps(value) if isinstance(value, dict) else value
+                for value in row.values()
+            )
+        buffer.seek(0)
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                    quote_name(model._meta.db_table),
+                    ', '.join(quote_name(columns[name]) for name in rows[0])
+                ),
+                buffer
+            )
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0013_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(default=None, max_length=6, null=True, unique=True, verbose_name='Короткая ссылка'),
+        ),
+    ]
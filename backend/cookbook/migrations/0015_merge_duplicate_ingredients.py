@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Объединение ингредиентов, загруженных повторными запусками."""
+    Ingredient = apps.get_model('cookbook', 'Ingredient')
+    RecipeIngredient = apps.get_model('cookbook', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).order_by().annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        first_id = duplicate['first_id']
+        duplicate_ids = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=first_id).values_list('id', flat=True)
+        for duplicate_id in duplicate_ids:
+            # Рецепт, где уже есть основной ингредиент, теряет дубль.
+            RecipeIngredient.objects.filter(
+                ingredient_id=duplicate_id,
+                recipe_id__in=RecipeIngredient.objects.filter(
+                    ingredient_id=first_id).values('recipe_id')
+            ).delete()
+            RecipeIngredient.objects.filter(
+                ingredient_id=duplicate_id).update(ingredient_id=first_id)
+        Ingredient.objects.filter(id__in=list(duplicate_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0014_recipe_short_link_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # icontains и istartswith сравнивают UPPER(name), поэтому индекс
+    # по самому name для них не подходит.
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS cookbook_ingredient_name_upper_trgm '
+        'ON cookbook_ingredient USING gin (UPPER(name) gin_trgm_ops)'
+    )
+    # По умолчанию планировщик считает оператор % дешёвым и на небольшом
+    # каталоге выбирает полный просмотр с вычислением сходства для каждой
+    # строки, что на порядок медленнее поиска по индексу.
+    schema_editor.execute(
+        'ALTER FUNCTION similarity_op(text, text) COST 100')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER FUNCTION similarity_op(text, text) COST 1')
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS cookbook_ingredient_name_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0016_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
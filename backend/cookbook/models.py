@@ -8,7 +8,7 @@ User = get_user_model()
 
 class Tag(models.Model):
     name = models.CharField('Название', max_length=32)
-    slug = models.SlugField('Слаг', max_length=32)
+    slug = models.SlugField('Слаг', max_length=32, unique=True)
 
     class Meta:
         ordering = ('id', 'name')
@@ -27,6 +27,12 @@ class Ingredient(models.Model):
         ordering = ('id', 'name')
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_measurement_unit'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -35,6 +41,10 @@ class Ingredient(models.Model):
 class Recipe(models.Model):
     name = models.CharField('Название рецепта', max_length=256)
     image = models.ImageField('Изображение', upload_to='recipe_images/')
+    image_renditions = models.JSONField(
+        'Уменьшенные копии изображения', default=dict, blank=True,
+        editable=False
+    )
     text = models.TextField('Описание')
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления в минутах',
@@ -53,13 +63,23 @@ class Recipe(models.Model):
         verbose_name='Ингредиент', related_name='recipes'
     )
     short_link = models.CharField(
-        'Короткая ссылка', max_length=6, null=True, default=None)
+        'Короткая ссылка', max_length=6, null=True, default=None,
+        unique=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ('-created_at',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-created_at',), name='recipe_created_at_idx'),
+            models.Index(
+                fields=('author', '-created_at'),
+                name='recipe_author_created_at_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -79,6 +80,40 @@ DATABASES = {
 #     }
 # }
 
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHE_OPTIONS = {}
+if 'memcached' not in CACHE_BACKEND:
+    # По умолчанию Django хранит лишь 300 записей; клиенты memcached
+    # этот параметр не принимают.
+    CACHE_OPTIONS['MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 20000))
+
+CACHES = {
+    # Версии, счётчики пагинации, короткие ссылки и снимки токенов.
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+        'OPTIONS': CACHE_OPTIONS,
+    },
+    # Объёмные данные с версией в ключе: представления рецептов, страницы
+    # ленты и списки покупок. Устаревшими они не бывают, поэтому хранятся
+    # в памяти процесса и не вытесняют версии из кэша default.
+    'payloads': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'payloads',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_PAYLOADS_MAX_ENTRIES', 5000)),
+        },
+    },
+    # LRU процесса для снимков токенов, если кэш default не общий.
+    'auth_tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth_tokens',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -96,11 +131,20 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginators.CustomPagination',
     'PAGE_SIZE': 6,
     'DEFAULT_FILTER_BACKENDS': [
@@ -139,6 +183,69 @@ AUTH_USER_MODEL = 'users.User'
 
 SHORT_LINK_MIN_LENGTH = os.getenv('SHORT_LINK_MIN_LENGTH', 3)
 
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60
+
 SITE_URL = os.getenv('SITE_URL')
 
 DEFAULT_RECIPES_LIMIT = 6
+
+# Стратегия подсчёта объектов в пагинации: exact, cached или estimate.
+PAGINATION_COUNT_STRATEGY = os.getenv('PAGINATION_COUNT_STRATEGY', 'exact')
+
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
+PAGINATION_EXACT_COUNT_LIMIT = 10000
+
+# Агрегат списка покупок живёт в памяти процесса, поэтому недолго.
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 10
+
+# Шрифт TrueType с кириллицей, встраиваемый в PDF списка покупок
+# (в образе ставится пакетом fonts-dejavu-core).
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Кэш ответов ленты и страниц рецептов для анонимных пользователей.
+RECIPES_CACHE_TIMEOUT = 60 * 10
+
+RECIPES_CACHE_MAX_AGE = 60
+
+INGREDIENT_INDEX_TIMEOUT = 60 * 10
+
+# Срок жизни собранного в процессе ответа списка тегов.
+TAGS_PAYLOAD_TIMEOUT = 60 * 10
+
+# Время жизни кэшированного снимка токена авторизации в общем кэше.
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 5
+# Время жизни снимка в LRU процесса: отозванный в другом процессе токен
+# принимается не дольше этого срока.
+AUTH_TOKEN_LOCAL_CACHE_TIMEOUT = 30
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Порог сходства для нечёткого поиска без PostgreSQL,
+# совпадает с pg_trgm.similarity_threshold по умолчанию.
+INGREDIENT_TRIGRAM_THRESHOLD = 0.3
+
+# Уменьшенные копии изображений: название копии и ограничивающий размер.
+IMAGE_RENDITIONS = {
+    'recipe': {
+        'thumbnail': (160, 160),
+        'card': (480, 480),
+        'detail': (1200, 1200),
+    },
+    'user': {
+        'thumbnail': (160, 160),
+    },
+}
+
+IMAGE_RENDITION_FORMAT = os.getenv('IMAGE_RENDITION_FORMAT', 'WEBP')
+
+IMAGE_RENDITION_QUALITY = 80
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+# Обработка изображений в потоке запроса вместо пула (для тестов).
+IMAGE_PROCESSING_EAGER = os.getenv(
+    'IMAGE_PROCESSING_EAGER', 'False').lower() == 'true'
@@ -54,6 +54,10 @@ class User(AbstractUser):
         null=True, blank=True,
         verbose_name='Аватар'
     )
+    avatar_renditions = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Уменьшенные копии аватара'
+    )
 
     objects = CustomUserManager()
 